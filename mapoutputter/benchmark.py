@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+import mapoutputter
+
+# 実データと同じ列構成
+MAP_PATTERN_COLUMNS = ["ID", "NightLord", "Special", "Start_190", "Treasure_800", "Event_30*0", "EventFlag",
+                       "EvPat_30**", "EvPatFlag", "RotRew_500", "Day1Boss", "Day1Loc", "Day2Boss", "Day2Loc",
+                       "extra1", "extra2"]
+COORD_COLUMNS = ["ID", "Name", "areaNo", "gridXNo", "gridZNo", "posX", "posZ", "picX", "picY"]
+CONSTRUCT_COLUMNS = ["ID", "MAP", "Struct", "is_display", ""]
+
+SPECIALS = [0, 1, 2, 3, 5]
+NIGHTLORDS = list(range(8))
+STARTS = list(range(700, 709))
+TREASURES = list(range(8000, 8012))
+FRENZY_FLAGS = [1044360220, 1044380230]
+ROTREWS = [1046300590, 1047300590, 1057300590]
+EVENT_FLAGS = [7705, 7724, 7725, 7800]
+BOSS_IDS = list(range(4800, 4830))
+CONSTRUCT_TYPES = list(range(30000, 30060)) + list(mapoutputter.SPECIAL_CONSTRUCT_TYPES)
+CONSTRUCTS_PER_MAP = 46  # 実データのCONSTRUCT.csvは1マップあたり約46行
+# seeker 用の JPEG の一辺
+SEEKER_SIZE = mapoutputter.SEEKER_JPEG_OUTPUT['size'][0]
+# render_size で描画したものと、フル解像度を縮小したものとの平均絶対差（0〜255）の、SEEKER_SIZE で描画したときの許容値
+PARITY_TOLERANCE = 0.8
+
+def _overlay(canvas, rng, color):
+    """
+    全面サイズで一部だけ不透明な重ね合わせ素材を作る
+    """
+    img = Image.new("RGBA", (canvas, canvas), (0, 0, 0, 0))
+    w = rng.randint(canvas // 10, canvas // 2)
+    h = rng.randint(canvas // 10, canvas // 2)
+    x = rng.randint(0, canvas - w)
+    y = rng.randint(0, canvas - h)
+    ImageDraw.Draw(img).ellipse((x, y, x + w, y + h), fill=color)
+    return img
+
+def make_fixture(folder, patterns, canvas=4775, seed=0):
+    """
+    MAP_PATTERN.csv / CONSTRUCT.csv / 座標.csv / NAME.csv と同じ形式の合成データと、
+    仮の素材PNGをfolderに作る。戻り値はgenerate_maps_from_csvに渡す引数の辞書
+    """
+    rng = random.Random(seed)
+    materials = os.path.join(folder, "assets")
+    os.makedirs(materials, exist_ok=True)
+
+    # 座標：イベント説明の位置(1200, 4300)付近は避けて散らす
+    margin = canvas // 20
+    coord_ids = list(range(100, 370))
+    with open(os.path.join(folder, "座標.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COORD_COLUMNS)
+        for coord_id in coord_ids:
+            x = rng.uniform(margin, canvas - margin)
+            y = rng.uniform(margin, canvas * 0.85)
+            writer.writerow([coord_id, "", 60, 0, 0, 0, 0, f"{x:.6f}", f"{y:.6f}"])
+
+    # 名称：ボス・イベント・拠点のID
+    with open(os.path.join(folder, "NAME.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        for name_id in BOSS_IDS + EVENT_FLAGS + [3030, 3080] + CONSTRUCT_TYPES:
+            writer.writerow([name_id, f"名称{name_id}", ""])
+
+    with open(os.path.join(folder, "MAP_PATTERN.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(MAP_PATTERN_COLUMNS)
+        for map_id in range(patterns):
+            event = rng.choice([0, 3030, 3080])
+            writer.writerow([
+                map_id, rng.choice(NIGHTLORDS), rng.choice(SPECIALS), rng.choice(STARTS), rng.choice(TREASURES),
+                event, rng.choice(EVENT_FLAGS), 3600, rng.choice(FRENZY_FLAGS) if event == 3080 else 0,
+                rng.choice([0] + ROTREWS), rng.choice(BOSS_IDS), rng.choice(coord_ids),
+                rng.choice(BOSS_IDS), rng.choice(coord_ids),
+                rng.choice([-1, -1, rng.choice(BOSS_IDS)]), -1,
+            ])
+
+    with open(os.path.join(folder, "CONSTRUCT.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CONSTRUCT_COLUMNS)
+        row_id = 0
+        for map_id in range(patterns):
+            for coord_id in rng.sample(coord_ids, CONSTRUCTS_PER_MAP):
+                is_display = 1 if rng.random() < 0.9 else 0
+                writer.writerow([row_id, map_id, rng.choice(CONSTRUCT_TYPES), is_display, coord_id])
+                row_id += 1
+
+    # 素材PNG
+    for special in SPECIALS:
+        color = (40 * special, 90, 120)
+        Image.new("RGB", (canvas, canvas), color).save(os.path.join(materials, f"background_{special}.png"))
+    for nightlord in NIGHTLORDS:
+        _overlay(canvas, rng, (200, 40, 40, 160)).save(os.path.join(materials, f"nightlord_{nightlord}.png"))
+    for treasure in TREASURES:
+        for special in SPECIALS:
+            _overlay(canvas, rng, (230, 200, 60, 200)).save(
+                os.path.join(materials, f"treasure_{treasure * 10 + special}.png"))
+    for start in STARTS:
+        _overlay(canvas, rng, (60, 200, 230, 220)).save(os.path.join(materials, f"Start_{start}.png"))
+    for flag in FRENZY_FLAGS:
+        _overlay(canvas, rng, (240, 200, 0, 180)).save(os.path.join(materials, f"Frenzy_{flag}.png"))
+    for rotrew in ROTREWS:
+        _overlay(canvas, rng, (120, 60, 20, 200)).save(os.path.join(materials, f"RotRew_{rotrew}.png"))
+    sprite = max(8, canvas // 12)
+    for construct_type in CONSTRUCT_TYPES:
+        img = Image.new("RGBA", (sprite, sprite), (0, 0, 0, 0))
+        ImageDraw.Draw(img).rectangle((2, 2, sprite - 3, sprite - 3), fill=(rng.randrange(256), 80, 200, 255))
+        img.save(os.path.join(materials, f"Construct_{construct_type}.png"))
+    circle = Image.new("RGBA", (sprite * 4, sprite * 4), (0, 0, 0, 0))
+    ImageDraw.Draw(circle).ellipse((0, 0, sprite * 4 - 1, sprite * 4 - 1), outline=(255, 255, 255, 255), width=8)
+    circle.save(os.path.join(materials, "night_circle.png"))
+
+    return {
+        'csv_file': os.path.join(folder, "MAP_PATTERN.csv"),
+        'materials_folder': materials,
+        'coordinates_file': os.path.join(folder, "座標.csv"),
+        'construct_file': os.path.join(folder, "CONSTRUCT.csv"),
+        'name_file': os.path.join(folder, "NAME.csv"),
+    }
+
+def run_benchmark(scales, canvas=4775, workers=1, outputs=None, keep=False, verbose=False, **options):
+    """
+    パターン数を変えて描画を計測する。戻り値はスケールごとの結果のリスト
+    """
+    results = []
+    for patterns in scales:
+        folder = tempfile.mkdtemp(prefix=f"mapoutputter_bench_{patterns}_")
+        try:
+            fixture = make_fixture(folder, patterns, canvas)
+            output_folder = os.path.join(folder, "output")
+            scale_outputs = None
+            if outputs is not None:
+                # 出力先フォルダは合成データのフォルダからの相対パスとして扱う
+                scale_outputs = [dict(o, folder=os.path.join(folder, o['folder'])) if o.get('folder') else o
+                                 for o in outputs]
+            start = time.perf_counter()
+            with open(os.devnull, "w", encoding="utf-8") as devnull:
+                # 描画中のログは既定では捨てる
+                quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(devnull)
+                with quiet:
+                    mapoutputter.generate_maps_from_csv(
+                        output_folder=output_folder, workers=workers, outputs=scale_outputs, profile=True,
+                        **fixture, **options)
+            wall = time.perf_counter() - start
+            with open(output_folder + ".profile.json", "r", encoding="utf-8") as f:
+                summary = json.load(f)
+            results.append({
+                'patterns': patterns,
+                'wall_seconds': wall,
+                'maps_per_second': patterns / wall if wall > 0 else None,
+                'map_seconds': summary['map_seconds'],
+                'peak_rss_mb': summary['peak_rss_mb']['max_process'],
+                'stages': {stage: s['total'] for stage, s in summary['stages'].items()},
+            })
+        finally:
+            if keep:
+                print(f"合成データを残しました: {folder}")
+            else:
+                shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+def check_render_size(render_size, canvas=1200, patterns=4, seed=0):
+    """
+    合成データを render_size で描画したものと、フル解像度で描画して同じ大きさに縮小したものを比べる。
+    戻り値は {インデクス: 平均絶対差（0〜255、RGBの平均）}
+    """
+    folder = tempfile.mkdtemp(prefix="mapoutputter_parity_")
+    try:
+        fixture = make_fixture(folder, patterns, canvas, seed)
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            full = dict(mapoutputter.iter_maps(**fixture))
+            native = dict(mapoutputter.iter_maps(**fixture, render_size=render_size))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    differences = {}
+    for idx, image in full.items():
+        reduced = image.resize(native[idx].size, Image.Resampling.LANCZOS).convert('RGB')
+        diff = ImageStat.Stat(ImageChops.difference(reduced, native[idx].convert('RGB'))).mean
+        differences[idx] = sum(diff) / len(diff)
+    return differences
+
+def parity_tolerance(render_size):
+    """
+    render_size で描画したときの平均絶対差の許容値。差は主に素材を整数の位置に置く丸め（1ピクセル未満）で
+    素材の縁に出るので、画像全体に占める縁の割合と同じく描画の幅に反比例させる
+    """
+    return PARITY_TOLERANCE * SEEKER_SIZE / render_size
+
+def print_results(results):
+    print(f"{'パターン数':>10}{'秒':>9}{'枚/秒':>8}{'p50':>8}{'p90':>8}{'p99':>8}{'RSS(MB)':>9}")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else "-"
+        m = r['map_seconds']
+        print(f"{r['patterns']:>10}{r['wall_seconds']:>9.1f}{r['maps_per_second']:>8.2f}"
+              f"{m['p50']:>8.3f}{m['p90']:>8.3f}{m['p99']:>8.3f}{rss:>9}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合成データでmapoutputterの描画速度を計測する")
+    parser.add_argument("--scales", default="10,320,3200", help="計測するパターン数（カンマ区切り）")
+    parser.add_argument("--canvas", type=int, default=4775, help="背景画像の一辺のピクセル数")
+    parser.add_argument("--workers", type=int, default=1, help="描画プロセス数")
+    parser.add_argument("--jpeg", action="store_true", help="PNGの代わりにseeker用のJPEGだけを書き出す")
+    parser.add_argument("--render-size", type=int, help="最初からこの幅で描画する（--jpeg と合わせて 2048 など）")
+    parser.add_argument("--check-render-size", action="store_true",
+                        help="計測の代わりに、--render-size（既定は seeker 用の縮小率）の描画が"
+                             "フル解像度を縮小したものと一致するか確かめる")
+    parser.add_argument("--json", help="結果をjsonで書き出すパス")
+    parser.add_argument("--keep", action="store_true", help="合成データと出力を削除しない")
+    parser.add_argument("--verbose", action="store_true", help="描画中のログを表示する")
+    args = parser.parse_args()
+
+    if args.check_render_size:
+        # 既定は seeker 用の JPEG と同じ縮小率（4775 → 2048）
+        render_size = args.render_size or round(args.canvas * SEEKER_SIZE / 4775)
+        differences = check_render_size(render_size, canvas=args.canvas)
+        for idx, diff in sorted(differences.items()):
+            print(f"map_{idx}: 平均差 {diff:.2f}")
+        worst = max(differences.values())
+        tolerance = parity_tolerance(render_size)
+        print(f"{args.canvas} → {render_size}ピクセル: 最大 {worst:.2f}（許容 {tolerance:.2f}）")
+        raise SystemExit(0 if worst <= tolerance else 1)
+
+    outputs = [dict(mapoutputter.SEEKER_JPEG_OUTPUT, folder="jpeg")] if args.jpeg else None
+    results = run_benchmark([int(s) for s in args.scales.split(",")], canvas=args.canvas, workers=args.workers,
+                            outputs=outputs, keep=args.keep, verbose=args.verbose, render_size=args.render_size)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
@@ -1,464 +1,1421 @@
-import pandas as pd
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
+import csv
+import hashlib
+import io
+import json
+import math
 import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 
-# 文字をいったん描画してから横方向だけ縮めて貼り付ける
-def draw_narrow_text(base_img, xy, text, font, fill, scale_x=0.80, **kwargs):
+try:
+    import resource  # Windowsには無い
+except ImportError:
+    resource = None
+
+# night_circle注記の影と文字色: ((xずれ, yずれ), 色) を描画順に並べる
+NIGHT_LABEL_LAYERS = (
+    ((-3, -3), (255, 255, 255)),
+    ((-1, -1), (255, 255, 255)),
+    ((1, 1), (0, 0, 0)),
+    ((3, 3), (0, 0, 0)),
+    ((5, 5), (0, 0, 0)),
+    ((7, 7), (0, 0, 0)),
+    ((0, 0), (120, 30, 240)),
+)
+
+# 拠点注記の影と文字色
+BUILDING_LABEL_LAYERS = (
+    ((4, 4), (0, 0, 0)),
+    ((-4, -4), (0, 0, 0)),
+    ((0, 0), (255, 255, 0)),
+)
+
+# 文字の形（アルファ値）をいったん描画してから横方向だけ縮める（同じ文字列は使い回す）
+@lru_cache(maxsize=4096)
+def narrow_text_mask(text, font, scale_x=0.80, **kwargs):
     """
-    文字を一度描いて横方向だけ縮めて貼り付ける。
-    縮小前後で“見た目の中心”が変わらないように、貼り付け時にx座標を自動補正する。
+    文字の形を一度だけ描いて横方向だけ縮めた "L" 画像と、中心を維持するためのx補正量を返す。
+    色違いの文字や影はすべてこの形から作る。返す画像は共有されるため、呼び出し側で書き換えないこと。
     """
-    d = ImageDraw.Draw(base_img)
+    d = ImageDraw.Draw(Image.new("L", (1, 1)))
     bbox = d.textbbox((0, 0), text, font=font, **kwargs)
     w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
 
-    tmp = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+    tmp = Image.new("L", (w, h), 0)
     d2 = ImageDraw.Draw(tmp)
-    d2.text((-bbox[0], -bbox[1]), text, font=font, fill=fill, **kwargs)
+    d2.text((-bbox[0], -bbox[1]), text, font=font, fill=255, **kwargs)
 
     new_w = max(1, int(w * scale_x))
     squeezed = tmp.resize((new_w, h), resample=Image.Resampling.BICUBIC)
+    return squeezed, (w - new_w) // 2  # 中央を維持するための補正
+
+@lru_cache(maxsize=1024)
+def label_sprite(text, font, layers, scale_x=0.60):
+    """
+    影付きラベルを1枚の画像にして返す。文字の形は narrow_text_mask で1回だけ描き、
+    影や縁取りはその形をずらして色を付けたものとして、layersの順に numpy で重ねる。
+    戻り値は (画像, 画像左上の描画位置からのずれ)
+    """
+    mask, offset_x = narrow_text_mask(text, font, scale_x)
+    alpha = np.asarray(mask, dtype=np.float32) / 255
+    h, w = alpha.shape
+    min_x = min(dx for (dx, _), _ in layers)
+    min_y = min(dy for (_, dy), _ in layers)
+    width = max(dx for (dx, _), _ in layers) - min_x + w
+    height = max(dy for (_, dy), _ in layers) - min_y + h
+
+    # 乗算済みの色とアルファで「上に重ねる」合成をする（色は連続した面ごとに計算する方が速い）
+    color = np.zeros((3, height, width), dtype=np.float32)
+    coverage = np.zeros((height, width), dtype=np.float32)
+    transparency = 1 - alpha
+    for (dx, dy), fill in layers:
+        y0, x0 = dy - min_y, dx - min_x
+        for channel, value in enumerate(fill[:3]):
+            c = color[channel, y0:y0 + h, x0:x0 + w]
+            c *= transparency
+            if value:
+                c += alpha * value
+        a = coverage[y0:y0 + h, x0:x0 + w]
+        a *= transparency
+        a += alpha
+
+    rgba = np.empty((height, width, 4), dtype=np.uint8)
+    safe = np.maximum(coverage, 1e-6)
+    for channel in range(3):
+        rgba[..., channel] = np.clip(color[channel] / safe + 0.5, 0, 255)
+    rgba[..., 3] = np.clip(coverage * 255 + 0.5, 0, 255)
+    return Image.fromarray(rgba, "RGBA"), (min_x + offset_x, min_y)
+
+def scale_label_layers(layers, scale):
+    """
+    影と縁取りのずれをscale倍する。ずれていた層は縮小しても1ピクセル以上ずらしたままにする
+    """
+    def shift(d):
+        if d == 0:
+            return 0
+        return int(math.copysign(max(1, round(abs(d) * scale)), d))
+    return tuple(((shift(dx), shift(dy)), fill) for (dx, dy), fill in layers)
 
+def draw_label(base_img, xy, text, font, layers, scale_x=0.60):
+    """
+    影付きラベルを1回の貼り付けで描画する
+    """
+    label, (dx, dy) = label_sprite(text, font, layers, scale_x)
     x, y = xy
-    x = x + (w - new_w) // 2  # 中央を維持するための補正
-    base_img.paste(squeezed, (x, y), squeezed)
+    base_img.paste(label, (x + dx, y + dy), label)
 
-def generate_maps_from_csv(csv_file, materials_folder, coordinates_file, construct_file, name_file, output_folder, font_path=None):
+def resize_by(img, scale):
     """
-    CSVファイルに基づいてマップを一括生成
+    画像をscale倍に縮小（拡大）して返す。1倍ならそのまま返す
+    """
+    if scale == 1:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.Resampling.LANCZOS)
+
+class AssetCache:
+    """
+    素材PNGをRGBAにデコードした状態で保持するキャッシュ。
+    同じ素材を何度もデコードしないようにし、合計サイズがmax_bytesを超えたら
+    最も長く使われていないものから破棄する。
+    scale: 1以外なら、読み込んだ素材をその倍率に縮小してから保持する（render_size指定時）。
+    返す画像は共有されるため、呼び出し側で直接書き換えないこと。
+    """
+    def __init__(self, max_bytes=1024 * 1024 * 1024, scale=1.0):
+        self.max_bytes = max_bytes
+        self.scale = scale
+        self._images = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.load_seconds = 0.0  # デコード（キャッシュミス時の読み込み）にかかった時間
+
+    def open(self, path):
+        """
+        pathの画像をRGBAで返す。Image.open(path).convert('RGBA')の置き換え
+        """
+        return self._get(path, lambda: resize_by(Image.open(path).convert('RGBA'), self.scale))
+
+    def open_overlay(self, path):
+        """
+        全面サイズの重ね合わせ素材を、不透明な部分（アルファの外接矩形）だけ切り出して返す。
+        戻り値は (切り出した画像, 元画像での左上位置)。完全に透明なら画像はNone
+        """
+        def load():
+            img = Image.open(path).convert('RGBA')
+            bbox = img.getchannel('A').getbbox()
+            if bbox is None:
+                return None, (0, 0)
+            if self.scale == 1:
+                return img.crop(bbox), bbox[:2]
+            # 縮小後の画素の境界に合わせて切り出し範囲を広げ、全体を縮小した場合と同じ位置に置く
+            x0, y0 = math.floor(bbox[0] * self.scale), math.floor(bbox[1] * self.scale)
+            x1, y1 = math.ceil(bbox[2] * self.scale), math.ceil(bbox[3] * self.scale)
+            box = (x0 / self.scale, y0 / self.scale, min(img.width, x1 / self.scale), min(img.height, y1 / self.scale))
+            return img.resize((x1 - x0, y1 - y0), Image.Resampling.LANCZOS, box=box), (x0, y0)
+        return self._get(('overlay', path), load)
+
+    @staticmethod
+    def _nbytes(value):
+        img = value[0] if isinstance(value, tuple) else value
+        return 0 if img is None else img.width * img.height * 4
+
+    def _get(self, key, load):
+        value = self._images.get(key)
+        if value is not None:
+            self._images.move_to_end(key)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        start = time.perf_counter()
+        value = load()
+        self.load_seconds += time.perf_counter() - start
+        size = self._nbytes(value)
+        if size > self.max_bytes:
+            return value  # 上限より大きい素材はキャッシュしない
+
+        self._images[key] = value
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, old = self._images.popitem(last=False)
+            self._bytes -= self._nbytes(old)
+        return value
+
+class AssetManifest:
+    """
+    素材フォルダのファイル名の一覧。フォルダは最初に1回だけ走査し、
+    描画中の存在確認はファイルシステムに問い合わせずにこの一覧で行う
+    """
+    def __init__(self, materials_folder):
+        self.folder = os.path.normcase(os.path.normpath(materials_folder))
+        try:
+            with os.scandir(materials_folder) as entries:
+                self.names = frozenset(os.path.normcase(entry.name) for entry in entries if entry.is_file())
+        except OSError:
+            self.names = frozenset()
+
+    def __contains__(self, path):
+        folder, name = os.path.split(path)
+        return os.path.normcase(os.path.normpath(folder)) == self.folder and os.path.normcase(name) in self.names
+
+class StageTimer:
+    """
+    描画の各段階の経過時間を記録する。lap()を呼ぶと前回のlap()からの時間をその段階に加算する
+    """
+    def __init__(self):
+        self.stages = {}
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last
+        self._last = now
+
+def peak_rss_mb():
+    """
+    このプロセスの最大常駐メモリ(MB)。取得できない環境ではNone
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト単位
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+# フォントを読み込めないときのデフォルトフォント（ImageFont.load_default()）の大きさ
+DEFAULT_FONT_SIZE = 10
+
+def load_fonts(font_path, verbose=True, scale=1.0):
+    """
+    イベント注記・night_circle注記・拠点注記用の3種類のフォントを読み込む
+    scale: フォントサイズの倍率（render_size指定時）。デフォルトフォントも同じ倍率で縮める
+    """
+    def size(points):
+        return max(1, round(points * scale))
+
+    if font_path and os.path.exists(font_path):
+        try:
+            font_event = ImageFont.truetype("Jiyucho.ttf", size(160))  # 特殊イベント注記用フォント
+            font_night = ImageFont.truetype("NotoSansJP-Medium.ttf", size(95))  # night_circle注記用フォント
+            font_building = ImageFont.truetype("NotoSansJP-Medium.ttf", size(65))  # 拠点注記用フォント
+            if verbose:
+                print(f"フォントの読み込みに成功しました: {font_path}")
+        except Exception as e:
+            font_event = font_night = font_building = ImageFont.load_default(size(DEFAULT_FONT_SIZE))
+            if verbose:
+                print(f"指定フォントを読み込めませんでした {font_path}，デフォルトフォントを使用: {e}")
+    else:
+        font_event = font_night = font_building = ImageFont.load_default(size(DEFAULT_FONT_SIZE))
+        if verbose:
+            print("デフォルトフォントを使用")
+    return font_event, font_night, font_building
+
+def base_layers(row, materials_folder):
+    """
+    背景と全面レイヤーを合成順に並べたリストを返す。
+    各要素は {'name': 表示名, 'path': 画像パス, 'mode': 合成方法}
     """
+    special_value = row['Special']
+    layers = [{
+        'name': '背景',
+        'path': os.path.join(materials_folder, f"background_{special_value}.png"),
+        'mode': 'background',
+    }]
+
+    # 特殊イベントをチェック - 列参照を修正（9列目EvPatFlagを使用）
+    if row['Event_30*0'] == 3080:
+        evpat_value = row['EvPatFlag']  # 9列目
+        # paste方式で特殊イベントアセットを合成
+        layers.append({
+            'name': 'Frenzy',
+            'path': os.path.join(materials_folder, f"Frenzy_{evpat_value}.png"),
+            'mode': 'paste',
+        })
+
+    # NightLordアセットを追加 - alpha_compositeを使用して透明度を正しく処理
+    layers.append({
+        'name': 'NightLord',
+        'path': os.path.join(materials_folder, f"nightlord_{row['NightLord']}.png"),
+        'mode': 'composite',
+    })
+
+    # Treasureアセットを追加 - alpha_compositeを使用
+    combined_value = row['Treasure_800'] * 10 + special_value
+    layers.append({
+        'name': 'Treasure',
+        'path': os.path.join(materials_folder, f"treasure_{combined_value}.png"),
+        'mode': 'composite',
+    })
+
+    # RotRew_500アセットを追加 - 値が0の場合を除いて追加
+    rotrew_value = row['RotRew_500']
+    if rotrew_value != 0:
+        layers.append({
+            'name': 'RotRew',
+            'path': os.path.join(materials_folder, f"RotRew_{rotrew_value}.png"),
+            'mode': 'composite',
+        })
+    return layers
+
+def compose_base(row, context):
+    """
+    背景に全面レイヤーを合成した画像を返す。背景が無い場合はNone。
+    直前の行で合成した途中結果をcontext['base_stack']に残しておき、
+    先頭から共通するレイヤーは合成し直さない。
+    返す画像は共有されるため、呼び出し側で複製してから描画すること
+    """
+    assets = context['assets']
+    manifest = context['asset_manifest']
+    layers = base_layers(row, context['materials_folder'])
+    stack = context['base_stack']
+
+    shared = 0
+    while shared < min(len(stack), len(layers)) and stack[shared][0] == layers[shared]['path']:
+        shared += 1
+    del stack[shared:]
+
+    for layer in layers[shared:]:
+        path = layer['path']
+        if layer['mode'] == 'background':
+            if path not in manifest:
+                return None  # 事前チェック（preflight）で報告済み
+            try:
+                image = assets.open(path)
+            except:
+                print(f"エラー：背景画像 {path}を読み込めないため、処理をスキップします")
+                return None
+            stack.append((path, image))
+            continue
+
+        image = stack[-1][1]
+        if path in manifest:
+            try:
+                # 不透明な範囲だけを合成する（前の段の画像は残しておくので複製してから）
+                layer_img, offset = assets.open_overlay(path)
+                if layer_img is not None:
+                    image = image.copy()
+                    if layer['mode'] == 'paste':
+                        image.paste(layer_img, offset, layer_img)
+                    else:
+                        image.alpha_composite(layer_img, offset)
+            except Exception as e:
+                print(f"エラー：{layer['name']}画像を処理できません {path}: {e}")
+        stack.append((path, image))
+
+    return stack[-1][1]
+
+def plan_compositions(tasks, materials_folder):
+    """
+    全面レイヤーの並びが共通する行が連続するようにタスクを並べ替える。
+    戻り値は (並べ替えたタスク, 全面レイヤーの合成回数, 並べ替え前の合成回数)
+    """
+    keys = {}
+    for idx, row, _ in tasks:
+        keys[idx] = tuple(layer['path'] for layer in base_layers(row, materials_folder))
+    planned = sorted(tasks, key=lambda task: keys[task[0]])
+
+    def count_composites(ordered):
+        count = 0
+        previous = ()
+        for idx, _, _ in ordered:
+            key = keys[idx]
+            shared = 0
+            while shared < min(len(previous), len(key)) and previous[shared] == key[shared]:
+                shared += 1
+            count += len(key) - shared
+            previous = key
+        return count
+
+    return planned, count_composites(planned), sum(len(key) for key in keys.values())
+
+def render_map(row, context, timer=None):
+    """
+    MAP_PATTERNの1行分のマップを描画して返す。背景が無い場合はNoneを返す
+    timer: StageTimerを渡すと段階ごとの経過時間を記録する
+    """
+    if timer is None:
+        timer = StageTimer()
+    materials_folder = context['materials_folder']
+    coord_dict = context['coord_dict']
+    name_dict = context['name_dict']
+    special_construct_dict = context['special_construct_dict']
+    normal_construct_dict = context['normal_construct_dict']
+    font_event, font_night, font_building = context['fonts']
+    night_circle_img = context['night_circle_img']
+    night_label_layers = context.get('night_label_layers', NIGHT_LABEL_LAYERS)
+    building_label_layers = context.get('building_label_layers', BUILDING_LABEL_LAYERS)
+    assets = context['assets']
+    # 素材・座標・名称が無いものは事前チェック（preflight）でまとめて報告済みなので、ここでは黙って飛ばす
+    manifest = context['asset_manifest']
+
+    # 元の解像度（背景画像の大きさ）での長さを、描画する解像度での画素数にする
+    scale = context.get('scale', 1.0)
+    def px(length):
+        return length * scale
+
+    # 背景と全面レイヤーは行をまたいで共有されるので、複製してから描画する
+    base = compose_base(row, context)
+    if base is None:
+        return None
+    background = base.copy()
+    draw = ImageDraw.Draw(background)
+    timer.lap('base')
+
+    event_value = row['Event_30*0']
+
+    # night_circleアセットを追加 - paste方式を使用
+    day1_loc = row['Day1Loc']
+    day1_boss = row['Day1Boss']
+    day1_extra = row['extra1']  # 15列目
+
+    day2_loc = row['Day2Loc']
+    day2_boss = row['Day2Boss']
+    day2_extra = row['extra2']  # 16列目
+
+    # night_circleの文字情報を保存、後で描画
+    night_circle_texts = []
+
+    if day1_loc in coord_dict:
+        x, y = coord_dict[day1_loc]
+        x_pos = int(round(x - night_circle_img.width // 2))
+        y_pos = int(round(y - night_circle_img.height // 2))
+        # paste方式で重ね合わせ
+        background.paste(night_circle_img, (x_pos, y_pos), night_circle_img)
     
-    os.makedirs(output_folder, exist_ok=True)
+        # night_circleのラベル文字情報を保存
+        if day1_boss in name_dict:
+            text = "DAY1 "+name_dict[day1_boss]
+            # textsizeの代わりにgetbboxを使用
+            bbox = font_night.getbbox(text)
+            text_width = bbox[2] - bbox[0]
+            text_height = bbox[3] - bbox[1]
+            text_x = int(round(x - text_width // 2))
+            text_y = int(round(y - text_height // 2))
+        
+            night_circle_texts.append({
+                'text': text,
+                'position': (text_x, text_y),
+                'font': font_night
+            })
+        
+            # 追加文字列を保存（15列目）
+            if day1_extra != -1 and day1_extra in name_dict:
+                extra_text = name_dict[day1_extra]
+                bbox_extra = font_night.getbbox(extra_text)
+                extra_width = bbox_extra[2] - bbox_extra[0]
+                extra_height = bbox_extra[3] - bbox_extra[1]
+                extra_x = int(round(x - extra_width // 2))
+                extra_y = int(round(text_y + text_height + px(5)))  # メインテキストの下
+            
+                night_circle_texts.append({
+                    'text': extra_text,
+                    'position': (extra_x, extra_y),
+                    'font': font_night
+                })
+
+    if day2_loc in coord_dict:
+        x, y = coord_dict[day2_loc]
+        x_pos = int(round(x - night_circle_img.width // 2))
+        y_pos = int(round(y - night_circle_img.height // 2))
+        # paste方式で重ね合わせ
+        background.paste(night_circle_img, (x_pos, y_pos), night_circle_img)
     
+        # night_circleのラベル文字情報を保存
+        if day2_boss in name_dict:
+            text = "DAY2 "+name_dict[day2_boss]
+            # textsizeの代わりにgetbboxを使用
+            bbox = font_night.getbbox(text)
+            text_width = bbox[2] - bbox[0]
+            text_height = bbox[3] - bbox[1]
+            text_x = int(round(x - text_width // 2))
+            text_y = int(round(y - text_height // 2))
+        
+            night_circle_texts.append({
+                'text': text,
+                'position': (text_x, text_y),
+                'font': font_night
+            })
+        
+            # 追加文字列を保存（16列目）
+            if day2_extra != -1 and day2_extra in name_dict:
+                extra_text = name_dict[day2_extra]
+                bbox_extra = font_night.getbbox(extra_text)
+                extra_width = bbox_extra[2] - bbox_extra[0]
+                extra_height = bbox_extra[3] - bbox_extra[1]
+                extra_x = int(round(x - extra_width // 2))
+                extra_y = int(round(text_y + text_height + px(5)))  # メインテキストの下
+            
+                night_circle_texts.append({
+                    'text': extra_text,
+                    'position': (extra_x, extra_y),
+                    'font': font_night
+                })
+
+    timer.lap('night_circle')
+
+    # 拠点アセットを追加 - まず特殊拠点を追加(49410/49420/49430)
+    current_map_id = row['ID']
+
+    # 拠点の文字情報を保存、後で描画
+    building_texts = []
+
+    # 特殊拠点を追加
+    if current_map_id in special_construct_dict:
+        for construct_type, coord_index in special_construct_dict[current_map_id]:
+        
+            if coord_index in coord_dict:
+                x, y = coord_dict[coord_index]
+            
+                construct_path = os.path.join(materials_folder, f"Construct_{construct_type}.png")
+                if construct_path in manifest:
+                    try:
+                        construct_img = assets.open(construct_path)
+                        # 位置を計算し、拠点アセットの中心が座標点に合うように配置
+                        x_pos = int(round(x - construct_img.width // 2))
+                        y_pos = int(round(y - construct_img.height // 2))
+                        # paste方式で重ね合わせ
+                        background.paste(construct_img, (x_pos, y_pos), construct_img)
+                    
+                        # 拠点のラベル文字情報を保存
+                        if construct_type in name_dict:
+                            text = name_dict[construct_type]
+                            # textsizeの代わりにgetbboxを使用
+                            bbox = font_building.getbbox(text)
+                            text_width = bbox[2] - bbox[0]
+                            text_height = bbox[3] - bbox[1]
+                            text_x = int(round(x - text_width // 2))
+                            text_y = int(round(y + construct_img.height // 2 + px(10)))  # 拠点の下
+                        
+                            building_texts.append({
+                                'text': text,
+                                'position': (text_x, text_y),
+                                'font': font_building
+                            })
+                    except Exception as e:
+                        print(f"エラー：拠点画像を処理できません {construct_path}: {e}")
+
+    # 通常拠点を追加
+    if current_map_id in normal_construct_dict:
+        for construct_type, coord_index in normal_construct_dict[current_map_id]:
+        
+            if coord_index in coord_dict:
+                x, y = coord_dict[coord_index]
+            
+                construct_path = os.path.join(materials_folder, f"Construct_{construct_type}.png")
+                if construct_path in manifest:
+                    try:
+                        construct_img = assets.open(construct_path)
+                        # 位置を計算し、拠点アセットの中心が座標点に合うように配置
+                        x_pos = int(round(x - construct_img.width // 2))
+                        y_pos = int(round(y - construct_img.height // 2))
+                        # paste方式で重ね合わせ
+                        background.paste(construct_img, (x_pos, y_pos), construct_img)
+                    
+                        # 拠点のラベル文字情報を保存
+                        if construct_type in name_dict:
+                            text = name_dict[construct_type]
+                            # textsizeの代わりにgetbboxを使用
+                            bbox = font_building.getbbox(text)
+                            text_width = bbox[2] - bbox[0]
+                            text_height = bbox[3] - bbox[1]
+                            text_x = int(round(x - text_width // 2))
+                            text_y = int(round(y + construct_img.height // 2 + px(10)))  # 拠点の下
+                        
+                            building_texts.append({
+                                'text': text,
+                                'position': (text_x, text_y),
+                                'font': font_building
+                            })
+                    except Exception as e:
+                        print(f"エラー：拠点画像を処理できません {construct_path}: {e}")
+
+    timer.lap('construct')
+
+    # Startアセットを追加 - 最上層に配置することを保証
+    start_value = row['Start_190']
+    start_path = os.path.join(materials_folder, f"Start_{start_value}.png")
+    if start_path in manifest:
+        try:
+            start_img, offset = assets.open_overlay(start_path)
+            # pasteではなくalpha_compositeを使用（不透明な範囲だけ）
+            if start_img is not None:
+                background.alpha_composite(start_img, offset)
+            # drawオブジェクトを再作成
+            draw = ImageDraw.Draw(background)
+        except Exception as e:
+            print(f"エラー：Start画像を処理できません {start_path}: {e}")
+
+    timer.lap('start')
+
+    # すべての文字を描画し、最前面に配置
+    # night_circle文字を描画
+    for text_info in night_circle_texts:
+        text, position, font = text_info['text'], text_info['position'], text_info['font']
+        x, y = position
+        # 座標が画像範囲内にあるかを確認
+        if 0 <= x < background.width and 0 <= y < background.height:
+            # 影付きの文字を追加
+            draw_label(background, (x, y), text, font, night_label_layers)
+
+    # 拠点文字を描画
+    for text_info in building_texts:
+        text, position, font = text_info['text'], text_info['position'], text_info['font']
+        x, y = position
+        # 座標が画像範囲内にあるかを確認
+        if 0 <= x < background.width and 0 <= y < background.height:
+            # 影付きの文字を追加
+            draw_label(background, (x, y), text, font, building_label_layers)
+
+    timer.lap('label')
+
+    # イベント説明の文字を追加
+    event_flag = row['EventFlag']
+    if event_flag in [7705, 7725]:
+        # 特殊イベント7705と7725
+        event_text = f"{name_dict.get(event_flag, event_flag)} {name_dict.get(event_value, event_value)}"
+    else:
+        event_text = f"{name_dict.get(event_flag, event_flag)}"
+
+    # 指定位置へイベント説明テキストを追加
+    event_x, event_y = int(round(px(1200))), int(round(px(4300)))
+    # getbboxを使用してテキストサイズを取得
+    bbox = font_event.getbbox(event_text)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+
+    # 座標が画像範囲内にあるかを確認
+    if 0 <= event_x < background.width and 0 <= event_y < background.height:
+        print(f"イベント説明テキストを描画: {event_text}、位置: ({event_x}, {event_y})")
+        # 文字に影を追加
+        shadow = int(round(px(15)))
+        draw.text((event_x+shadow, event_y+shadow), event_text, font=font_event, fill=(115,15,230))
+        # 文字を追加
+        draw.text((event_x, event_y), event_text, font=font_event, fill=(255,255,255))
+    else:
+        print(f"警告: イベント説明テキスト座標 ({event_x}, {event_y}) が画像の範囲を超えています")
+    timer.lap('event_text')
+
+    return background
+
+# 特殊拠点として先に描画する拠点タイプ
+SPECIAL_CONSTRUCT_TYPES = (49410, 49420, 49430)
+
+class CoordTable:
+    """
+    座標インデクス → (x, y) の表。インデクスをそのまま配列の添字に使う
+    """
+    def __init__(self, ids, xs, ys):
+        ids = np.asarray(ids, dtype=np.int64)
+        size = int(ids.max()) + 1 if len(ids) else 0
+        self.xy = np.zeros((size, 2), dtype=np.float64)
+        self.valid = np.zeros(size, dtype=bool)
+        self.xy[ids, 0] = xs
+        self.xy[ids, 1] = ys
+        self.valid[ids] = True
+
+    def __contains__(self, index):
+        return 0 <= index < len(self.valid) and bool(self.valid[index])
+
+    def __getitem__(self, index):
+        if index not in self:
+            raise KeyError(index)
+        x, y = self.xy[index]
+        return float(x), float(y)
+
+    def get(self, index, default=None):
+        return self[index] if index in self else default
+
+    def scaled(self, scale):
+        """
+        座標をscale倍した表を返す
+        """
+        table = CoordTable.__new__(CoordTable)
+        table.xy = self.xy * scale
+        table.valid = self.valid
+        return table
+
+def _group_constructs(map_ids, types, coords):
+    """
+    拠点をマップIDごとにまとめ、{マップID: [(拠点タイプ, 座標インデクス), ...]} を返す。
+    同じマップ内の並び順はCSVの行順のまま
+    """
+    order = np.argsort(map_ids, kind='stable')
+    map_ids, types, coords = map_ids[order], types[order], coords[order]
+    unique_ids, starts = np.unique(map_ids, return_index=True)
+    ends = np.append(starts[1:], len(map_ids))
+    types, coords = types.tolist(), coords.tolist()
+    return {
+        map_id: list(zip(types[start:end], coords[start:end]))
+        for map_id, start, end in zip(unique_ids.tolist(), starts.tolist(), ends.tolist())
+    }
+
+def load_tables(csv_file, coordinates_file, construct_file, name_file):
+    """
+    CSVをまとめて読み込み、描画ループで使う検索用の表を作る。
+    patterns: MAP_PATTERNの各行の辞書（15・16列目は extra1 / extra2 に揃える）
+    coords: CoordTable
+    names: {ID: 名称}
+    special_constructs / normal_constructs: {マップID: [(拠点タイプ, 座標インデクス), ...]}
+    """
+    # pandas は読み込みに時間がかかるので、CSV を読むときだけ使う（パターンデータベースからは使わない）
+    import pandas as pd
+
     print("データCSVファイルを読み込み中…")
     data_df = pd.read_csv(csv_file)
+    patterns = data_df.to_dict('records')
+    extra_columns = list(data_df.columns[14:16])
+    for row in patterns:
+        for key, column in zip(('extra1', 'extra2'), extra_columns + [None, None]):
+            row[key] = row[column] if column is not None else -1
     
     print("座標CSVファイルを読み込み中…")
     coord_df = pd.read_csv(coordinates_file)
-    coord_dict = {}
-    for _, row in coord_df.iterrows():
-        index_val = row.iloc[0]
-        x_coord = row.iloc[7]
-        y_coord = row.iloc[8]
-        coord_dict[index_val] = (x_coord, y_coord)
+    coords = CoordTable(coord_df.iloc[:, 0].to_numpy(), coord_df.iloc[:, 7].to_numpy(), coord_df.iloc[:, 8].to_numpy())
     
     print("拠点情報CSVファイルを読み込み中…")
     construct_df = pd.read_csv(construct_file)
     
     # 名称マッピングファイルを読み込み
     print("名称マッピングファイルを読み込み中…")
-    name_df = pd.read_csv(name_file,header=None)
-    name_dict = {}
-    for _, row in name_df.iterrows():
-        name_dict[row.iloc[0]] = row.iloc[1]
-    
-    # 2つの辞書を作成し、特殊拠点と通常拠点をそれぞれ格納する
-    special_construct_dict = {}  # 49410/49420/49430
-    normal_construct_dict = {}   # その他の拠点
-    
-    for _, construct_row in construct_df.iterrows():
-        map_id = construct_row.iloc[1]
-        show_flag = construct_row.iloc[3]
-        
-        if show_flag == 1:
-            construct_type = construct_row.iloc[2]
-            coord_index = construct_row.iloc[4]
-            
-            # 特殊拠点判定
-            if construct_type in [49410, 49420, 49430]:
-                if map_id not in special_construct_dict:
-                    special_construct_dict[map_id] = []
-                special_construct_dict[map_id].append({
-                    'type': construct_type,
-                    'coord_index': coord_index
-                })
-            else:
-                if map_id not in normal_construct_dict:
-                    normal_construct_dict[map_id] = []
-                normal_construct_dict[map_id].append({
-                    'type': construct_type,
-                    'coord_index': coord_index
-                })
-    
-    # フォント読み込み、3種類のサイズのフォントを作成
-    font_event = None
-    font_night = None
-    font_building = None
+    name_df = pd.read_csv(name_file, header=None)
+    names = dict(zip(name_df.iloc[:, 0].tolist(), name_df.iloc[:, 1].tolist()))
     
-    if font_path and os.path.exists(font_path):
+    tables = {'patterns': patterns, 'coords': coords, 'names': names}
+    tables.update(_construct_tables(construct_df.iloc[:, 1].to_numpy(), construct_df.iloc[:, 2].to_numpy(),
+                                    construct_df.iloc[:, 3].to_numpy(), construct_df.iloc[:, 4].to_numpy()))
+    return tables
+
+def _construct_tables(map_ids, types, display, coord_indexes):
+    """
+    表示フラグが1の拠点だけを、特殊拠点(49410/49420/49430)とその他の拠点に分ける
+    """
+    shown = display == 1
+    map_ids, types, coord_indexes = map_ids[shown], types[shown], coord_indexes[shown]
+    is_special = np.isin(types, SPECIAL_CONSTRUCT_TYPES)
+    return {
+        'special_constructs': _group_constructs(map_ids[is_special], types[is_special], coord_indexes[is_special]),
+        'normal_constructs': _group_constructs(map_ids[~is_special], types[~is_special], coord_indexes[~is_special]),
+    }
+
+def load_tables_from_db(db):
+    """
+    patterndb.PatternDB から load_tables と同じ表を作る（pandas も CSV の解析も使わない）
+    """
+    patterns = db.patterns()
+    columns = db.meta['pattern_columns']
+    for row in patterns:
+        for key, column in zip(('extra1', 'extra2'), columns[14:16] + [None, None]):
+            row[key] = row[column] if column is not None else -1
+
+    def column(name):
+        return np.frombuffer(db[name], dtype=np.dtype(db[name].typecode))
+
+    tables = {
+        'patterns': patterns,
+        'coords': CoordTable(column('coord:id'), column('coord:x'), column('coord:y')),
+        'names': db.names(),
+    }
+    tables.update(_construct_tables(column('construct:map'), column('construct:type'),
+                                    column('construct:display'), column('construct:coord')))
+    return tables
+
+# 描画結果に影響する入力をまとめたマニフェストの形式バージョン
+MANIFEST_VERSION = 1
+
+def _json_default(value):
+    """
+    numpyの数値型などをjsonに書ける値へ変換する
+    """
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+def file_digest(path, digests):
+    """
+    ファイル内容のSHA-1を返す。存在しない場合はNone。digestsに結果を覚えておく
+    """
+    if path not in digests:
+        if os.path.exists(path):
+            h = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+            digests[path] = h.hexdigest()
+        else:
+            digests[path] = None
+    return digests[path]
+
+def map_asset_paths(row, context):
+    """
+    render_mapが1行分の描画で参照する素材ファイルのパス一覧を返す
+    """
+    materials_folder = context['materials_folder']
+    paths = [layer['path'] for layer in base_layers(row, materials_folder)]
+    names = [f"Start_{row['Start_190']}.png", "night_circle.png"]
+    map_id = row['ID']
+    for constructs in (context['special_construct_dict'], context['normal_construct_dict']):
+        for construct_type, _ in constructs.get(map_id, []):
+            names.append(f"Construct_{construct_type}.png")
+    return paths + [os.path.join(materials_folder, name) for name in names]
+
+def map_fingerprint(row, context, digests, build_key=''):
+    """
+    1枚のマップの入力（パターン行・拠点行・参照する座標と名称・素材ファイル）のハッシュを返す。
+    build_keyには描画スクリプトやフォントなど全マップ共通の入力のハッシュを渡す
+    """
+    coord_dict = context['coord_dict']
+    name_dict = context['name_dict']
+    map_id = row['ID']
+    special = context['special_construct_dict'].get(map_id, [])
+    normal = context['normal_construct_dict'].get(map_id, [])
+
+    coord_keys = [row['Day1Loc'], row['Day2Loc']]
+    name_keys = [row['Day1Boss'], row['Day2Boss'], row['EventFlag'], row['Event_30*0']]
+    name_keys += [row['extra1'], row['extra2']]
+    for construct_type, coord_index in special + normal:
+        coord_keys.append(coord_index)
+        name_keys.append(construct_type)
+
+    inputs = {
+        'build': build_key,
+        'row': row,
+        'special': special,
+        'normal': normal,
+        'coords': [[key, coord_dict.get(key)] for key in coord_keys],
+        'names': [[key, name_dict.get(key)] for key in name_keys],
+        'assets': [[path, file_digest(path, digests)] for path in map_asset_paths(row, context)],
+    }
+    encoded = json.dumps(inputs, sort_keys=True, default=_json_default, ensure_ascii=False)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+def manifest_path(output_folder):
+    """
+    出力フォルダの隣に置くマニフェストファイルのパス
+    """
+    return os.path.normpath(output_folder) + ".manifest.json"
+
+def load_manifest(output_folder):
+    """
+    前回のビルドで書き出したマニフェストを読む。無い・壊れている場合は空
+    """
+    path = manifest_path(output_folder)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('maps', {})
+
+def save_manifest(output_folder, maps):
+    """
+    マップごとのフィンガープリントをマニフェストに書き出す
+    """
+    path = manifest_path(output_folder)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'maps': maps}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+# 出力形式の設定。1枚描画するごとに、リストのすべての形式で書き出す
+#   format: 'PNG' / 'JPEG' / 'WEBP'
+#   folder: 出力先フォルダ（Noneならoutput_folder）
+#   size:   縮小後のサイズ (幅, 高さ)。Noneならフル解像度
+#   quality: JPEG / WEBP の画質
+DEFAULT_OUTPUTS = (
+    {'format': 'PNG', 'folder': None, 'size': None},
+)
+
+# seeker/JPEG にそのまま使える 2048x2048 のJPEG
+SEEKER_JPEG_OUTPUT = {'format': 'JPEG', 'folder': os.path.join('..', 'seeker', 'JPEG'), 'size': (2048, 2048), 'quality': 90}
+
+OUTPUT_EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp'}
+
+def output_targets(idx, outputs, output_folder):
+    """
+    1枚分の出力先を [(出力設定, パス), ...] で返す
+    """
+    targets = []
+    for output in outputs:
+        folder = output.get('folder') or output_folder
+        ext = OUTPUT_EXTENSIONS[output['format']]
+        targets.append((output, os.path.join(folder, f"map_{idx}.{ext}")))
+    return targets
+
+def save_outputs(image, targets, timer=None):
+    """
+    描画済みの画像を各出力形式で保存する。同じサイズへの縮小は1回だけ行う。
+    保存に失敗したファイルは消しておき、差分ビルドで次回作り直されるようにする
+    """
+    if timer is None:
+        timer = StageTimer()
+    resized = {}
+    for output, path in targets:
+        size = output.get('size')
+        if size is None or tuple(size) == image.size:
+            img = image
+        else:
+            size = tuple(size)
+            if size not in resized:
+                resized[size] = image.resize(size, Image.Resampling.LANCZOS)
+                timer.lap('resize')
+            img = resized[size]
+
+        img, params = _prepare_for_save(img, output)
         try:
-            font_event = ImageFont.truetype("Jiyucho.ttf", 160)  # 特殊イベント注記用フォント
-            font_night = ImageFont.truetype("NotoSansJP-Medium.ttf", 95)  # night_circle注記用フォント
-            font_building = ImageFont.truetype("NotoSansJP-Medium.ttf", 65)  # 拠点注記用フォント
-            print(f"フォントの読み込みに成功しました: {font_path}")
+            img.save(path, format=output['format'], **params)
         except Exception as e:
-            font_event = ImageFont.load_default()
-            font_night = ImageFont.load_default()
-            font_building = ImageFont.load_default()
-            print(f"指定フォントを読み込めませんでした {font_path}，デフォルトフォントを使用: {e}")
+            print(f"エラー：画像を保存できません {path}: {e}")
+            if os.path.exists(path):
+                os.remove(path)
+        timer.lap('encode')
+
+def _prepare_for_save(img, output):
+    """
+    出力形式に合わせて、保存する画像と save() に渡す引数を返す
+    """
+    params = {}
+    if output['format'] in ('JPEG', 'WEBP'):
+        params['quality'] = output.get('quality', 90)
+    if output['format'] == 'JPEG':
+        img = img.convert('RGB')
+    return img, params
+
+def encode_output(image, output):
+    """
+    描画済みの画像を1つの出力形式（DEFAULT_OUTPUTSの要素と同じ形）でエンコードし、bytesで返す
+    """
+    size = output.get('size')
+    if size is not None and tuple(size) != image.size:
+        image = image.resize(tuple(size), Image.Resampling.LANCZOS)
+    image, params = _prepare_for_save(image, output)
+    buffer = io.BytesIO()
+    image.save(buffer, format=output['format'], **params)
+    return buffer.getvalue()
+
+# ワーカープロセスごとに保持する描画コンテキスト
+_worker_context = None
+
+# workers を指定しないときのプロセス数の上限。フル解像度（4775x4775）では1プロセスあたり、
+# 素材キャッシュとは別に全面レイヤーの途中結果（compose_base、1段約91MB×最大5段）・描画中の画像・
+# 保存待ちの画像で 1GB 近く使う（benchmark.py の計測で約 0.9GB）。コア数の多いマシンでもメモリを使い切らないよう抑える
+MAX_DEFAULT_WORKERS = 4
+
+def default_workers():
+    """
+    workers を指定しないときのプロセス数（CPU コア数、ただし MAX_DEFAULT_WORKERS まで）
+    """
+    return min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS)
+
+def _init_worker(context, font_path, asset_cache_bytes, encode_threads, profile_dir=None):
+    """
+    ワーカープロセスの初期化。フォントと素材キャッシュはプロセスごとに用意する
+    profile_dir: 計測結果をプロセスごとのファイルに書き出すフォルダ（Noneなら計測しない）
+    """
+    global _worker_context
+    _worker_context = dict(context)
+    scale = context.get('scale', 1.0)
+    _worker_context['fonts'] = load_fonts(font_path, verbose=False, scale=scale)
+    _worker_context['assets'] = AssetCache(asset_cache_bytes, scale)
+    _worker_context['base_stack'] = []  # compose_baseの途中結果
+    # 保存（縮小とエンコード）は別スレッドで行い、次のマップの描画と重ねる
+    _worker_context['encoder'] = ThreadPoolExecutor(max_workers=encode_threads)
+    _worker_context['encoding'] = deque()
+    _worker_context['max_encoding'] = encode_threads
+    _worker_context['profile_file'] = None
+    if profile_dir:
+        _worker_context['profile_file'] = os.path.join(profile_dir, f"{os.getpid()}.jsonl")
+        _worker_context['profile_lock'] = threading.Lock()
+
+def _write_profile(record):
+    """
+    計測結果を1行のjsonとして追記する（描画スレッドと保存スレッドの両方から呼ばれる）
+    """
+    record['pid'] = os.getpid()
+    record['rss_mb'] = peak_rss_mb()
+    with _worker_context['profile_lock']:
+        with open(_worker_context['profile_file'], 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+
+def _save_and_profile(idx, background, targets):
+    """
+    保存スレッドで実行する。計測が有効なら保存の経過時間も記録する
+    """
+    if _worker_context['profile_file'] is None:
+        save_outputs(background, targets)
+        return
+    timer = StageTimer()
+    save_outputs(background, targets, timer)
+    _write_profile({'map': idx, 'stages': timer.stages})
+
+def _render_and_save(task):
+    """
+    ワーカープロセスで1枚描画し、保存をエンコード用スレッドに渡す。描画できたかどうかを返す
+    """
+    idx, row, targets = task
+    assets = _worker_context['assets']
+    timer = StageTimer()
+    load_seconds = assets.load_seconds
+    background = render_map(row, _worker_context, timer)
+    if _worker_context['profile_file'] is not None:
+        labels = label_sprite.cache_info()
+        _write_profile({
+            'map': idx,
+            'stages': timer.stages,
+            'decode': assets.load_seconds - load_seconds,  # base / construct / start に含まれる
+            'asset_hits': assets.hits,
+            'asset_misses': assets.misses,
+            'label_hits': labels.hits,
+            'label_misses': labels.misses,
+        })
+    if background is None:
+        return idx, False
+
+    # 保存待ちの画像を溜めすぎないよう、空きが出るまで待つ
+    encoding = _worker_context['encoding']
+    while len(encoding) >= _worker_context['max_encoding']:
+        encoding.popleft().result()
+    encoding.append(_worker_context['encoder'].submit(_save_and_profile, idx, background, targets))
+    return idx, True
+
+def _render_to_memory(task):
+    """
+    ワーカープロセスで1枚描画し、(インデクス, 画像またはエンコードしたbytes) を返す。描画できなければ None
+    """
+    idx, row, output = task
+    image = render_map(row, _worker_context)
+    if image is None or output is None:
+        return idx, image
+    return idx, encode_output(image, output)
+
+def _finish_encoding():
+    """
+    保存待ちの画像をすべて書き終えるまで待つ
+    （並列時はワーカープロセスの終了時にスレッドの終了を待つので呼ばなくてよい）
+    """
+    encoding = _worker_context['encoding']
+    while encoding:
+        encoding.popleft().result()
+    _worker_context['encoder'].shutdown()
+
+def _percentile(sorted_values, q):
+    """
+    並べ替え済みのリストからqパーセンタイル（最近傍順位法）を返す
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def load_profile_records(profile_dir):
+    """
+    ワーカーが書き出した計測結果を読み、マップごとにまとめる。
+    戻り値は ({マップ番号: {段階: 秒}}, {pid: そのプロセスの最終的な集計値})
+    """
+    per_map = {}
+    per_process = {}
+    for name in os.listdir(profile_dir):
+        with open(os.path.join(profile_dir, name), 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                stages = per_map.setdefault(record['map'], {})
+                for stage, seconds in record['stages'].items():
+                    stages[stage] = stages.get(stage, 0.0) + seconds
+                if 'decode' in record:
+                    stages['decode'] = stages.get('decode', 0.0) + record['decode']
+                process = per_process.setdefault(record['pid'], {})
+                for key in ('asset_hits', 'asset_misses', 'label_hits', 'label_misses', 'rss_mb'):
+                    if record.get(key) is not None:
+                        process[key] = max(process.get(key, 0), record[key])
+    return per_map, per_process
+
+def write_profile_report(profile_dir, output_folder, wall_seconds, top_n=10):
+    """
+    計測結果を集計し、出力フォルダの隣に profile.json / profile.csv を書き出して、
+    段階ごとの合計時間と遅いマップの上位top_n件を表示する
+    """
+    per_map, per_process = load_profile_records(profile_dir)
+    # decodeは他の段階の内訳なので、マップごとの合計には含めない
+    totals = {idx: sum(s for stage, s in stages.items() if stage != 'decode') for idx, stages in per_map.items()}
+    stage_names = sorted({stage for stages in per_map.values() for stage in stages})
+
+    stage_summary = {}
+    for stage in stage_names:
+        values = sorted(stages.get(stage, 0.0) for stages in per_map.values())
+        stage_summary[stage] = {
+            'total': sum(values),
+            'mean': sum(values) / len(values),
+            'p50': _percentile(values, 50),
+            'p95': _percentile(values, 95),
+            'max': values[-1],
+        }
+    latencies = sorted(totals.values())
+    rss_values = [p['rss_mb'] for p in per_process.values() if p.get('rss_mb') is not None]
+    parent_rss = peak_rss_mb()
+    summary = {
+        'maps': len(per_map),
+        'wall_seconds': wall_seconds,
+        'maps_per_second': len(per_map) / wall_seconds if wall_seconds > 0 else None,
+        'map_seconds': {
+            'p50': _percentile(latencies, 50),
+            'p90': _percentile(latencies, 90),
+            'p99': _percentile(latencies, 99),
+            'max': latencies[-1] if latencies else 0.0,
+        },
+        'stages': stage_summary,
+        'asset_cache': {
+            'hits': sum(p.get('asset_hits', 0) for p in per_process.values()),
+            'misses': sum(p.get('asset_misses', 0) for p in per_process.values()),
+        },
+        'label_cache': {
+            'hits': sum(p.get('label_hits', 0) for p in per_process.values()),
+            'misses': sum(p.get('label_misses', 0) for p in per_process.values()),
+        },
+        'peak_rss_mb': {
+            'max_process': max(rss_values + ([parent_rss] if parent_rss else []), default=None),
+            'main_process': parent_rss,
+            'workers': {str(pid): p.get('rss_mb') for pid, p in per_process.items()},
+        },
+        'per_map': [dict(map=idx, total=totals[idx], **per_map[idx]) for idx in sorted(per_map)],
+    }
+
+    base_path = os.path.normpath(output_folder)
+    with open(base_path + ".profile.json", 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=1)
+    with open(base_path + ".profile.csv", 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['map', 'total'] + stage_names)
+        for idx in sorted(per_map):
+            writer.writerow([idx, f"{totals[idx]:.4f}"] + [f"{per_map[idx].get(stage, 0.0):.4f}" for stage in stage_names])
+
+    print(f"計測結果: {summary['maps']}枚 / {wall_seconds:.1f}秒"
+          + (f"（{summary['maps_per_second']:.2f}枚/秒）" if summary['maps_per_second'] else ""))
+    print(f"{'段階':<14}{'合計(秒)':>10}{'平均':>9}{'p95':>9}")
+    for stage, s in sorted(stage_summary.items(), key=lambda item: -item[1]['total']):
+        print(f"{stage:<14}{s['total']:>10.2f}{s['mean']:>9.3f}{s['p95']:>9.3f}")
+    hits, misses = summary['asset_cache']['hits'], summary['asset_cache']['misses']
+    print(f"素材キャッシュ: ヒット{hits}回 / ミス{misses}回")
+    hits, misses = summary['label_cache']['hits'], summary['label_cache']['misses']
+    print(f"ラベルキャッシュ: ヒット{hits}回 / ミス{misses}回")
+    if summary['peak_rss_mb']['max_process'] is not None:
+        print(f"最大常駐メモリ: {summary['peak_rss_mb']['max_process']:.0f}MB（プロセスごとの最大値）")
+    print(f"時間のかかったマップ 上位{top_n}件:")
+    for idx in sorted(totals, key=lambda i: -totals[i])[:top_n]:
+        top_stages = sorted(per_map[idx].items(), key=lambda item: -item[1])[:3]
+        detail = ", ".join(f"{stage} {seconds:.2f}" for stage, seconds in top_stages)
+        print(f"  map_{idx}: {totals[idx]:.2f}秒 ({detail})")
+    return summary
+
+def render_scale(patterns, manifest, materials_folder, render_size):
+    """
+    背景画像の幅を render_size にする倍率を返す。背景のヘッダーだけを読む。背景が1枚も無ければ 1.0
+    """
+    for row in patterns:
+        path = base_layers(row, materials_folder)[0]['path']
+        if path in manifest:
+            try:
+                with Image.open(path) as img:
+                    return render_size / img.width
+            except OSError:
+                continue
+    return 1.0
+
+def _import_patterndb():
+    """
+    CSV をまとめたパターンデータベース（seeker と共通の seeker/patterndb.py）を読み込む。
+    pattern_db を指定したときだけ使うので、seeker のフォルダが無くても CSV からは描画できる
+    """
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'seeker')
+    if folder not in sys.path:
+        sys.path.append(folder)
+    import patterndb
+    return patterndb
+
+def prepare_context(csv_file, materials_folder, coordinates_file, construct_file, name_file, pattern_db=None, render_size=None):
+    """
+    CSV（またはパターンデータベース）と night_circle.png を読み込み、素材フォルダを1回だけ走査して
+    事前チェックを行う。(MAP_PATTERNの各行のリスト, 描画コンテキスト) を返す。night_circle.png が読めなければ None
+    render_size: 描画する画像の幅（ピクセル）。指定すると座標・素材・フォント・影のずれをこの大きさに合わせて縮め、
+                 フル解像度で描画してから縮小する代わりに最初からこの大きさで描画する。Noneなら背景画像と同じ大きさ
+    """
+    if pattern_db:
+        db = _import_patterndb().compile_if_stale(pattern_db, map_pattern=csv_file, construct=construct_file,
+                                        coordinates=coordinates_file, names=name_file)
+        tables = load_tables_from_db(db)
     else:
-        font_event = ImageFont.load_default()
-        font_night = ImageFont.load_default()
-        font_building = ImageFont.load_default()
-        print("デフォルトフォントを使用")
+        tables = load_tables(csv_file, coordinates_file, construct_file, name_file)
     
+    manifest = AssetManifest(materials_folder)
     night_circle_path = os.path.join(materials_folder, "night_circle.png")
-    if not os.path.exists(night_circle_path):
+    if night_circle_path not in manifest:
         print(f"エラー：night_circle.pngが存在しません {night_circle_path}")
-        return
+        return None
     
     try:
         night_circle_img = Image.open(night_circle_path).convert('RGBA')
     except:
         print(f"エラー：night_circle.pngを読み込めません {night_circle_path}")
+        return None
+
+    coords = tables['coords']
+    scale = 1.0
+    if render_size:
+        scale = render_scale(tables['patterns'], manifest, materials_folder, render_size)
+    if scale != 1:
+        coords = coords.scaled(scale)
+        night_circle_img = resize_by(night_circle_img, scale)
+        print(f"{render_size}ピクセル幅で描画します（素材・座標・フォントを{scale:.3f}倍）")
+
+    context = {
+        'materials_folder': materials_folder,
+        'coord_dict': coords,
+        'name_dict': tables['names'],
+        'special_construct_dict': tables['special_constructs'],
+        'normal_construct_dict': tables['normal_constructs'],
+        'night_circle_img': night_circle_img,
+        'asset_manifest': manifest,
+        'scale': scale,
+        'night_label_layers': scale_label_layers(NIGHT_LABEL_LAYERS, scale),
+        'building_label_layers': scale_label_layers(BUILDING_LABEL_LAYERS, scale),
+    }
+    preflight(tables['patterns'], context)
+    return tables['patterns'], context
+
+def iter_maps(csv_file, materials_folder, coordinates_file, construct_file, name_file, font_path=None, workers=1, asset_cache_mb=1024, output=None, max_in_flight=None, pattern_db=None, render_size=None):
+    """
+    マップを1枚ずつ描画し、(インデクス, 画像) を順に返すジェネレータ。ファイルには書き出さない。
+    インデクスは generate_maps_from_csv の map_{インデクス} と同じ。描画できなかったマップの画像は None
+    output: Noneならフル解像度の PIL.Image を返す。出力形式（DEFAULT_OUTPUTSの要素と同じ形、folderは無視）を
+            渡すと、その大きさ・形式でエンコードした bytes を返す（並列時はプロセス間の受け渡しも小さくなる）
+    max_in_flight: 並列時に、描画中と受け取り待ちを合わせたマップ数の上限（Noneなら workers の2倍）。
+                   受け取る側が止まると新しい描画も止まるので、メモリ上の画像はこの枚数を超えない
+    render_size: 最初からこの幅で描画する（prepare_context を参照）。output の size と同じにすれば縮小も不要になる
+    返す順は全面レイヤーの共通部分を使い回せる順（plan_compositions）で、インデクス順ではない
+    """
+    prepared = prepare_context(csv_file, materials_folder, coordinates_file, construct_file, name_file, pattern_db,
+                               render_size)
+    if prepared is None:
         return
+    patterns, context = prepared
+    tasks = [(idx, row, output) for idx, row in enumerate(patterns)]
+    tasks, _, _ = plan_compositions(tasks, materials_folder)
     
-    print("画像生成を開始…")
-    for idx, row in data_df.iterrows():
-        special_value = row['Special']
-        background_path = os.path.join(materials_folder, f"background_{special_value}.png")
-        
-        if not os.path.exists(background_path):
-            print(f"警告: 背景画像{background_path}が存在しないため、処理をスキップします")
-            continue
-            
+    if workers is None:
+        workers = default_workers()
+    # 素材キャッシュの上限は全プロセスの合計。各ワーカーには等分して渡す
+    asset_cache_bytes = asset_cache_mb * 1024 * 1024 // max(1, workers)
+    if workers <= 1:
+        _init_worker(context, font_path, asset_cache_bytes, 1)
         try:
-            background = Image.open(background_path).convert('RGBA')
-        except:
-            print(f"エラー：背景画像 {background_path}を読み込めないため、処理をスキップします")
+            for task in tasks:
+                yield _render_to_memory(task)
+        finally:
+            _finish_encoding()
+        return
+    
+    if max_in_flight is None:
+        max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(context, font_path, asset_cache_bytes, 1)) as executor:
+        pending = deque()
+        try:
+            for task in tasks:
+                if len(pending) >= max(1, max_in_flight):
+                    yield pending.popleft().result()
+                pending.append(executor.submit(_render_to_memory, task))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # 途中で受け取りをやめたときは、まだ始まっていない描画を取り消す
+            for future in pending:
+                future.cancel()
+
+def preflight(patterns, context, limit=20):
+    """
+    描画の前に、全行が参照する素材・座標・名称をまとめて確認し、見つからないものを1回だけ報告する。
+    名称は夜の王の注記（DAY1/DAY2のボスと追加文字列）を確認する（拠点名は無ければ注記しないだけなので確認しない）。
+    戻り値は {種類: Counter({見つからないもの: 参照しているマップ数})}
+    """
+    manifest = context['asset_manifest']
+    coord_dict = context['coord_dict']
+    name_dict = context['name_dict']
+    missing = {'素材': Counter(), '座標': Counter(), '名称': Counter()}
+    for row in patterns:
+        map_id = row['ID']
+        assets = {os.path.basename(path) for path in map_asset_paths(row, context) if path not in manifest}
+        coords = {row['Day1Loc'], row['Day2Loc']}
+        for constructs in (context['special_construct_dict'], context['normal_construct_dict']):
+            coords.update(coord_index for _, coord_index in constructs.get(map_id, []))
+        coords = {key for key in coords if key not in coord_dict}
+        names = {row['Day1Boss'], row['Day2Boss']}
+        names.update(key for key in (row['extra1'], row['extra2']) if key != -1)
+        names = {key for key in names if key not in name_dict}
+        missing['素材'].update(assets)
+        missing['座標'].update(coords)
+        missing['名称'].update(names)
+
+    if not any(missing.values()):
+        print(f"事前チェック: {len(patterns)}枚分の素材・座標・名称はすべて揃っています")
+        return missing
+    print("事前チェック: 見つからないものがあります（該当する部分は描画せず、背景が無いマップは生成しません）")
+    for kind, counter in missing.items():
+        if not counter:
             continue
-            
-        draw = ImageDraw.Draw(background)
-        
-        # 特殊イベントをチェック - 列参照を修正（9列目EvPatFlagを使用）
-        event_value = row['Event_30*0']
-        if event_value == 3080:
-            evpat_value = row['EvPatFlag']  # 9列目
-            frenzy_path = os.path.join(materials_folder, f"Frenzy_{evpat_value}.png")
-            if os.path.exists(frenzy_path):
-                try:
-                    frenzy_img = Image.open(frenzy_path).convert('RGBA')
-                    # paste方式で特殊イベントアセットを合成
-                    background.paste(frenzy_img, (0, 0), frenzy_img)
-                    # drawオブジェクトを再作成
-                    draw = ImageDraw.Draw(background)
-                except Exception as e:
-                    print(f"エラー：Frenzy画像を処理できません {frenzy_path}: {e}")
-            else:
-                print(f"警告: Frenzy画像が存在しません {frenzy_path}")
-        
-        # NightLordアセットを追加 - alpha_compositeを使用して透明度を正しく処理
-        nightlord_value = row['NightLord']
-        nightlord_path = os.path.join(materials_folder, f"nightlord_{nightlord_value}.png")
-        if os.path.exists(nightlord_path):
-            try:
-                nightlord_img = Image.open(nightlord_path).convert('RGBA')
-                # pasteではなくalpha_compositeを使用
-                background = Image.alpha_composite(background, nightlord_img)
-                # drawオブジェクトを再作成
-                draw = ImageDraw.Draw(background)
-            except Exception as e:
-                print(f"エラー：NightLord画像を処理できません {nightlord_path}: {e}")
-        else:
-            print(f"警告: NightLord画像が存在しません {nightlord_path}")
-        
-        # Treasureアセットを追加 - alpha_compositeを使用
-        treasure_value = row['Treasure_800']
-        combined_value = treasure_value * 10 + special_value
-        treasure_path = os.path.join(materials_folder, f"treasure_{combined_value}.png")
-        if os.path.exists(treasure_path):
-            try:
-                treasure_img = Image.open(treasure_path).convert('RGBA')
-                # pasteではなくalpha_compositeを使用
-                background = Image.alpha_composite(background, treasure_img)
-                # drawオブジェクトを再作成
-                draw = ImageDraw.Draw(background)
-            except Exception as e:
-                print(f"エラー：Treasure画像を処理できません {treasure_path}: {e}")
-        else:
-            print(f"警告: Treasure画像が存在しません {treasure_path}")
-        
-        # RotRew_500アセットを追加 - 値が0の場合を除いて追加
-        rotrew_value = row['RotRew_500']
-        if rotrew_value != 0:  # 値が0の場合のみ処理
-            rotrew_path = os.path.join(materials_folder, f"RotRew_{rotrew_value}.png")
-            if os.path.exists(rotrew_path):
-                try:
-                    rotrew_img = Image.open(rotrew_path).convert('RGBA')
-                    # alpha_compositeでレイヤーを結合
-                    background = Image.alpha_composite(background, rotrew_img)
-                    # drawオブジェクトを再作成
-                    draw = ImageDraw.Draw(background)
-                except Exception as e:
-                    print(f"エラー：RotRew画像を処理できません {rotrew_path}: {e}")
-            else:
-                print(f"警告: RotRew画像が存在しません {rotrew_path}")
-        
-        # night_circleアセットを追加 - paste方式を使用
-        day1_loc = row['Day1Loc']
-        day1_boss = row['Day1Boss']
-        day1_extra = row.iloc[14] if len(row) > 14 else -1  # 15列目
-        
-        day2_loc = row['Day2Loc']
-        day2_boss = row['Day2Boss']
-        day2_extra = row.iloc[15] if len(row) > 15 else -1  # 16列目
-        
-        # night_circleの文字情報を保存、後で描画
-        night_circle_texts = []
-        
-        if day1_loc in coord_dict:
-            x, y = coord_dict[day1_loc]
-            x_pos = int(round(x - night_circle_img.width // 2))
-            y_pos = int(round(y - night_circle_img.height // 2))
-            # paste方式で重ね合わせ
-            background.paste(night_circle_img, (x_pos, y_pos), night_circle_img)
-            
-            # night_circleのラベル文字情報を保存
-            if day1_boss in name_dict:
-                text = "DAY1 "+name_dict[day1_boss]
-                # textsizeの代わりにgetbboxを使用
-                bbox = font_night.getbbox(text)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-                text_x = int(round(x - text_width // 2))
-                text_y = int(round(y - text_height // 2))
-                
-                night_circle_texts.append({
-                    'text': text,
-                    'position': (text_x, text_y),
-                    'font': font_night
-                })
-                
-                # 追加文字列を保存（15列目）
-                if day1_extra != -1 and day1_extra in name_dict:
-                    extra_text = name_dict[day1_extra]
-                    bbox_extra = font_night.getbbox(extra_text)
-                    extra_width = bbox_extra[2] - bbox_extra[0]
-                    extra_height = bbox_extra[3] - bbox_extra[1]
-                    extra_x = int(round(x - extra_width // 2))
-                    extra_y = int(round(text_y + text_height + 5))  # メインテキストの下
-                    
-                    night_circle_texts.append({
-                        'text': extra_text,
-                        'position': (extra_x, extra_y),
-                        'font': font_night
-                    })
-        else:
-            print(f"警告: 座標 {day1_loc} は座標ファイルに存在しません")
-        
-        if day2_loc in coord_dict:
-            x, y = coord_dict[day2_loc]
-            x_pos = int(round(x - night_circle_img.width // 2))
-            y_pos = int(round(y - night_circle_img.height // 2))
-            # paste方式で重ね合わせ
-            background.paste(night_circle_img, (x_pos, y_pos), night_circle_img)
-            
-            # night_circleのラベル文字情報を保存
-            if day2_boss in name_dict:
-                text = "DAY2 "+name_dict[day2_boss]
-                # textsizeの代わりにgetbboxを使用
-                bbox = font_night.getbbox(text)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-                text_x = int(round(x - text_width // 2))
-                text_y = int(round(y - text_height // 2))
-                
-                night_circle_texts.append({
-                    'text': text,
-                    'position': (text_x, text_y),
-                    'font': font_night
-                })
-                
-                # 追加文字列を保存（16列目）
-                if day2_extra != -1 and day2_extra in name_dict:
-                    extra_text = name_dict[day2_extra]
-                    bbox_extra = font_night.getbbox(extra_text)
-                    extra_width = bbox_extra[2] - bbox_extra[0]
-                    extra_height = bbox_extra[3] - bbox_extra[1]
-                    extra_x = int(round(x - extra_width // 2))
-                    extra_y = int(round(text_y + text_height + 5))  # メインテキストの下
-                    
-                    night_circle_texts.append({
-                        'text': extra_text,
-                        'position': (extra_x, extra_y),
-                        'font': font_night
-                    })
-        else:
-            print(f"警告: 座標 {day2_loc} は座標ファイルに存在しません")
-        
-        # 拠点アセットを追加 - まず特殊拠点を追加(49410/49420/49430)
-        current_map_id = row['ID']
-        
-        # 拠点の文字情報を保存、後で描画
-        building_texts = []
-        
-        # 特殊拠点を追加
-        if current_map_id in special_construct_dict:
-            for construct_info in special_construct_dict[current_map_id]:
-                construct_type = construct_info['type']
-                coord_index = construct_info['coord_index']
-                
-                if coord_index in coord_dict:
-                    x, y = coord_dict[coord_index]
-                    
-                    construct_path = os.path.join(materials_folder, f"Construct_{construct_type}.png")
-                    if os.path.exists(construct_path):
-                        try:
-                            construct_img = Image.open(construct_path).convert('RGBA')
-                            # 位置を計算し、拠点アセットの中心が座標点に合うように配置
-                            x_pos = int(round(x - construct_img.width // 2))
-                            y_pos = int(round(y - construct_img.height // 2))
-                            # paste方式で重ね合わせ
-                            background.paste(construct_img, (x_pos, y_pos), construct_img)
-                            
-                            # 拠点のラベル文字情報を保存
-                            if construct_type in name_dict:
-                                text = name_dict[construct_type]
-                                # textsizeの代わりにgetbboxを使用
-                                bbox = font_building.getbbox(text)
-                                text_width = bbox[2] - bbox[0]
-                                text_height = bbox[3] - bbox[1]
-                                text_x = int(round(x - text_width // 2))
-                                text_y = int(round(y + construct_img.height // 2 + 10))  # 拠点の下
-                                
-                                building_texts.append({
-                                    'text': text,
-                                    'position': (text_x, text_y),
-                                    'font': font_building
-                                })
-                        except Exception as e:
-                            print(f"エラー：拠点画像を処理できません {construct_path}: {e}")
-                    else:
-                        print(f"警告: 拠点画像が存在しません {construct_path}")
-                else:
-                    print(f"警告: 座標インデクス {coord_index} は座標ファイルに存在しません")
-        
-        # 通常拠点を追加
-        if current_map_id in normal_construct_dict:
-            for construct_info in normal_construct_dict[current_map_id]:
-                construct_type = construct_info['type']
-                coord_index = construct_info['coord_index']
-                
-                if coord_index in coord_dict:
-                    x, y = coord_dict[coord_index]
-                    
-                    construct_path = os.path.join(materials_folder, f"Construct_{construct_type}.png")
-                    if os.path.exists(construct_path):
-                        try:
-                            construct_img = Image.open(construct_path).convert('RGBA')
-                            # 位置を計算し、拠点アセットの中心が座標点に合うように配置
-                            x_pos = int(round(x - construct_img.width // 2))
-                            y_pos = int(round(y - construct_img.height // 2))
-                            # paste方式で重ね合わせ
-                            background.paste(construct_img, (x_pos, y_pos), construct_img)
-                            
-                            # 拠点のラベル文字情報を保存
-                            if construct_type in name_dict:
-                                text = name_dict[construct_type]
-                                # textsizeの代わりにgetbboxを使用
-                                bbox = font_building.getbbox(text)
-                                text_width = bbox[2] - bbox[0]
-                                text_height = bbox[3] - bbox[1]
-                                text_x = int(round(x - text_width // 2))
-                                text_y = int(round(y + construct_img.height // 2 + 10))  # 拠点の下
-                                
-                                building_texts.append({
-                                    'text': text,
-                                    'position': (text_x, text_y),
-                                    'font': font_building
-                                })
-                        except Exception as e:
-                            print(f"エラー：拠点画像を処理できません {construct_path}: {e}")
-                    else:
-                        print(f"警告: 拠点画像が存在しません {construct_path}")
-                else:
-                    print(f"警告: 座標インデクス {coord_index} は座標ファイルに存在しません")
-        
-        # Startアセットを追加 - 最上層に配置することを保証
-        start_value = row['Start_190']
-        start_path = os.path.join(materials_folder, f"Start_{start_value}.png")
-        if os.path.exists(start_path):
-            try:
-                start_img = Image.open(start_path).convert('RGBA')
-                # pasteではなくalpha_compositeを使用
-                background = Image.alpha_composite(background, start_img)
-                # drawオブジェクトを再作成
-                draw = ImageDraw.Draw(background)
-            except Exception as e:
-                print(f"エラー：Start画像を処理できません {start_path}: {e}")
-        else:
-            print(f"警告: Start画像が存在しません {start_path}")
-        
-        # すべての文字を描画し、最前面に配置
-        shadow_color1 = (255,255,255)
-        shadow_color2 = (0,0,0)
-        text_color = (255, 0, 0)  # 赤文字
-                
-        # night_circle文字を描画
-        for text_info in night_circle_texts:
-            text, position, font = text_info['text'], text_info['position'], text_info['font']
-            x, y = position
-            # 座標が画像範囲内にあるかを確認
-            if 0 <= x < background.width and 0 <= y < background.height:
-                # 文字に影を追加
-                draw_narrow_text(background, (x-3, y-3), text, font=font, fill=shadow_color1, scale_x=0.60)
-                draw_narrow_text(background, (x-1, y-1), text, font=font, fill=shadow_color1, scale_x=0.60)
-                draw_narrow_text(background, (x+1, y+1), text, font=font, fill=shadow_color2, scale_x=0.60)
-                draw_narrow_text(background, (x+3, y+3), text, font=font, fill=shadow_color2, scale_x=0.60)
-                draw_narrow_text(background, (x+5, y+5), text, font=font, fill=shadow_color2, scale_x=0.60)
-                draw_narrow_text(background, (x+7, y+7), text, font=font, fill=shadow_color2, scale_x=0.60)
-                # 文字を追加
-                draw_narrow_text(background, (x, y), text, font, fill=(120, 30, 240), scale_x=0.60)
-        
-        # 拠点文字を描画
-        for text_info in building_texts:
-            text, position, font = text_info['text'], text_info['position'], text_info['font']
-            x, y = position
-            # 座標が画像範囲内にあるかを確認
-            if 0 <= x < background.width and 0 <= y < background.height:
-                # 文字に影を追加
-                draw_narrow_text(background, (x+4, y+4), text, font=font, fill=(0,0,0), scale_x=0.60)
-                draw_narrow_text(background, (x-4, y-4), text, font=font, fill=(0,0,0), scale_x=0.60)
-                # 文字を追加
-                draw_narrow_text(background, (x, y), text, font, fill=(255, 255, 0), scale_x=0.60)
-        
-        # イベント説明の文字を追加
-        event_flag = row['EventFlag']
-        if event_flag in [7705, 7725]:
-            # 特殊イベント7705と7725
-            event_text = f"{name_dict.get(event_flag, event_flag)} {name_dict.get(event_value, event_value)}"
-        else:
-            event_text = f"{name_dict.get(event_flag, event_flag)}"
-        
-        # 指定位置へイベント説明テキストを追加
-        event_x, event_y = int(round(1200)), int(round(4300))
-        # getbboxを使用してテキストサイズを取得
-        bbox = font_event.getbbox(event_text)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        
-        # 座標が画像範囲内にあるかを確認
-        if 0 <= event_x < background.width and 0 <= event_y < background.height:
-            print(f"イベント説明テキストを描画: {event_text}、位置: ({event_x}, {event_y})")
-            # 文字に影を追加
-            draw.text((event_x+15, event_y+15), event_text, font=font_event, fill=(115,15,230))
-            # 文字を追加
-            draw.text((event_x, event_y), event_text, font=font_event, fill=(255,255,255))
-        else:
-            print(f"警告: イベント説明テキスト座標 ({event_x}, {event_y}) が画像の範囲を超えています")
-        
-        # 画像を1/4サイズに縮小
-        original_width, original_height = background.size
-        new_size = (original_width // 5, original_height // 5)
-        resized_background = background.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # 画像を保存
-        output_path = os.path.join(output_folder, f"map_{idx}.png")
-        background.save(output_path)
-        
-        # カウントの出力を修正
-        if (idx + 1) % 10 == 0:
-            print(f"{idx + 1}枚の画像を生成しました…")
+        print(f"  {kind}: {len(counter)}件")
+        for key, maps in counter.most_common(limit):
+            print(f"    {key}（{maps}マップ）")
+        if len(counter) > limit:
+            print(f"    ほか{len(counter) - limit}件")
+    return missing
+
+def generate_maps_from_csv(csv_file, materials_folder, coordinates_file, construct_file, name_file, output_folder, font_path=None, workers=1, asset_cache_mb=1024, incremental=False, outputs=None, encode_threads=2, profile=False, pattern_db=None, render_size=None):
+    """
+    CSVファイルに基づいてマップを一括生成
+    workers: 並列に描画するプロセス数（1なら従来どおり逐次処理、Noneなら default_workers()）。
+             フル解像度では1プロセスあたり約1GBを使う（MAX_DEFAULT_WORKERS を参照）
+    asset_cache_mb: デコード済み素材を保持するメモリ上限（全プロセスの合計、MB単位。プロセスごとには workers で割った分）
+    incremental: Trueなら入力が前回から変わったマップだけを描画し直す
+    outputs: 出力形式のリスト（DEFAULT_OUTPUTSを参照）。Noneならフル解像度のPNGのみ
+    encode_threads: 保存（縮小とエンコード）を行うスレッド数（プロセスごと）
+    profile: Trueなら段階ごとの経過時間などを計測し、出力フォルダの隣に
+             <output_folder>.profile.json / .profile.csv を書き出す
+    pattern_db: パターンデータベース（seeker/patterndb.py）のパス。指定するとCSVの代わりにこれを読む。
+                CSVが前回のコンパイルから変わっていれば、先にコンパイルし直す
+    render_size: フル解像度ではなく最初からこの幅で描画する（prepare_context を参照）。
+                 seeker用のJPEGやプレビューだけが要るときに、メモリと描画の手間を大きく減らせる
+    """
+    start_time = time.perf_counter()
+    if outputs is None:
+        outputs = DEFAULT_OUTPUTS
+
+    os.makedirs(output_folder, exist_ok=True)
+    for output in outputs:
+        if output.get('folder'):
+            os.makedirs(output['folder'], exist_ok=True)
+    
+    prepared = prepare_context(csv_file, materials_folder, coordinates_file, construct_file, name_file, pattern_db,
+                               render_size)
+    if prepared is None:
+        return
+    patterns, context = prepared
+    
+    tasks = [(idx, row, output_targets(idx, outputs, output_folder)) for idx, row in enumerate(patterns)]
+    
+    # 差分ビルド：フィンガープリントが前回と同じで出力が残っているマップは描き直さない
+    fingerprints = {}
+    if incremental:
+        digests = {}
+        build_key = hashlib.sha1(json.dumps([
+            file_digest(os.path.abspath(__file__), digests),
+            font_path,
+            file_digest("Jiyucho.ttf", digests),
+            file_digest("NotoSansJP-Medium.ttf", digests),
+            list(outputs),
+            context['scale'],
+        ], sort_keys=True).encode('utf-8')).hexdigest()
+        previous = load_manifest(output_folder)
+        pending = []
+        for task in tasks:
+            idx, row, targets = task
+            name = f"map_{idx}"
+            fingerprints[name] = map_fingerprint(row, context, digests, build_key)
+            if previous.get(name) != fingerprints[name] or not all(os.path.exists(path) for _, path in targets):
+                pending.append(task)
+        print(f"差分ビルド: {len(tasks)}枚中{len(pending)}枚を再生成します")
+        tasks = pending
+    
+    # 全面レイヤーが共通する行をまとめ、共通部分の合成を使い回す
+    tasks, planned_composites, naive_composites = plan_compositions(tasks, materials_folder)
+    print(f"全面レイヤーの合成: {naive_composites}回 → {planned_composites}回")
+    
+    if workers is None:
+        workers = default_workers()
+    # 素材キャッシュの上限は全プロセスの合計。各ワーカーには等分して渡す
+    asset_cache_bytes = asset_cache_mb * 1024 * 1024 // max(1, workers)
+    profile_dir = tempfile.mkdtemp(prefix="mapoutputter_profile_") if profile else None
+    
+    print("画像生成を開始…")
+    done = 0
+    failed = set()
+    if workers <= 1:
+        _init_worker(context, font_path, asset_cache_bytes, encode_threads, profile_dir)
+        for idx, ok in map(_render_and_save, tasks):
+            if not ok:
+                failed.add(f"map_{idx}")
+            done += 1
+            if done % 10 == 0:
+                print(f"{done}枚の画像を生成しました…")
+        _finish_encoding()
+    else:
+        print(f"{workers}プロセスで並列に生成します")
+        # map()は入力順に結果を返すので、進捗表示もタスク順のまま出力される
+        # 連続したタスクが同じワーカーに渡るので、共通ベースの使い回しも効く
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(context, font_path, asset_cache_bytes, encode_threads, profile_dir)) as executor:
+            for idx, ok in executor.map(_render_and_save, tasks, chunksize=chunksize):
+                if not ok:
+                    failed.add(f"map_{idx}")
+                done += 1
+                if done % 10 == 0:
+                    print(f"{done}枚の画像を生成しました…")
+    
+    if incremental:
+        # 描画できなかったマップは次回も再生成の対象にする
+        save_manifest(output_folder, {name: fp for name, fp in fingerprints.items() if name not in failed})
+    
+    if profile:
+        write_profile_report(profile_dir, output_folder, time.perf_counter() - start_time)
+        shutil.rmtree(profile_dir, ignore_errors=True)
     
     print("すべての画像の生成が完了しました！")
 
@@ -470,6 +1427,16 @@ if __name__ == "__main__":
     MATERIALS_FOLDER = "assets"
     OUTPUT_FOLDER = "output"
     FONT_PATH = "NotoSansJP-Medium.ttf"  # フォントのパスを指定可能（例："arial.ttf"）
+    WORKERS = default_workers()  # 並列描画のプロセス数（1で逐次処理）。フル解像度では1プロセスあたり約1GB
+    INCREMENTAL = True  # 入力が変わったマップだけを再生成する
+    PROFILE = False  # Trueで段階ごとの計測結果を output.profile.json / .csv に書き出す
+    PATTERN_DB = None  # CSVをまとめたデータベース（例：os.path.join("..", "seeker", "patterns.db")）。Noneならpandasで CSV を読む
+    RENDER_SIZE = None  # 例：2048 で最初から2048ピクセル幅で描画する（プレビューやseeker用だけが要るとき）
+    # フル解像度のPNGに加えて、seeker/JPEG 用のJPEGも同時に書き出す
+    OUTPUTS = [
+        {'format': 'PNG', 'folder': None, 'size': None},
+        SEEKER_JPEG_OUTPUT,
+    ]
     
     generate_maps_from_csv(
         csv_file=DATA_CSV_FILE,
@@ -478,5 +1445,11 @@ if __name__ == "__main__":
         construct_file=CONSTRUCT_CSV_FILE,
         name_file=NAME_CSV_FILE,
         output_folder=OUTPUT_FOLDER,
-        font_path=FONT_PATH
+        font_path=FONT_PATH,
+        workers=WORKERS,
+        incremental=INCREMENTAL,
+        outputs=OUTPUTS,
+        profile=PROFILE,
+        pattern_db=PATTERN_DB,
+        render_size=RENDER_SIZE
     )
\ No newline at end of file
@@ -0,0 +1,26 @@
+import argparse
+import os
+import re
+
+import seeker
+
+def build_archive(output=seeker.MAP_ARCHIVE_PATH, map_folder=seeker.MAP_FOLDER):
+    """
+    map_folder の map_*.jpg を1つのまとめファイルにする。seeker のフォルダで実行する
+    """
+    files = []
+    for name in os.listdir(map_folder):
+        m = re.fullmatch(r"map_(\d+)\.jpg", name)
+        if m:
+            files.append((int(m.group(1)), os.path.join(map_folder, name)))
+    entries = seeker.MapArchive.write(output, files)
+    size = os.path.getsize(output)
+    print(f"{output}: {len(entries)}枚 ({size / 1024 / 1024:.1f} MB)")
+    return entries
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="seeker のマップ画像を1つのファイルにまとめる")
+    parser.add_argument("--output", default=seeker.MAP_ARCHIVE_PATH, help="書き出すファイルのパス")
+    parser.add_argument("--folder", default=seeker.MAP_FOLDER, help="マップ画像のフォルダ")
+    args = parser.parse_args()
+    build_archive(args.output, args.folder)
@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import re
+
+from PIL import Image, PngImagePlugin
+
+import seeker
+
+def pack(sizes, width):
+    """
+    大きさのリストを、高さの大きい順に幅 width の棚へ左から詰める。
+    戻り値は入力と同じ順の (x, y) と、全体の高さ
+    """
+    positions = [None] * len(sizes)
+    x = y = shelf_height = 0
+    for i in sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0])):
+        w, h = sizes[i]
+        if x + w > width:
+            x, y = 0, y + shelf_height
+            shelf_height = 0
+        positions[i] = (x, y)
+        x += w
+        shelf_height = max(shelf_height, h)
+    return positions, y + shelf_height
+
+def build_atlas(output=seeker.ATLAS_PATH, map_folder="JPEG", width=2048):
+    """
+    seeker のボタンのアイコンとマップのサムネイルを、表示する大きさに縮小して1枚の PNG にまとめる。
+    索引は PNG のテキスト（seeker.IconAtlas.INDEX_KEY）に json で入れる。seeker のフォルダで実行する
+    """
+    map_ids = sorted(int(m.group(1)) for name in os.listdir(map_folder)
+                     if (m := re.fullmatch(r"map_(\d+)\.jpg", name)))
+
+    entries = []
+    for path, size in seeker.atlas_entries(map_ids):
+        try:
+            entries.append((path, size, seeker.render_icon(path, size)))
+        except OSError as e:
+            print(f"読み込めないので飛ばします: {path} ({e})")
+
+    positions, height = pack([img.size for _, _, img in entries], width)
+    atlas = Image.new("RGBA", (width, max(1, height)), (0, 0, 0, 0))
+    index = []
+    for (path, size, img), (x, y) in zip(entries, positions):
+        atlas.paste(img.convert("RGBA"), (x, y))
+        index.append({"path": path, "size": list(size), "box": [x, y, img.width, img.height]})
+
+    info = PngImagePlugin.PngInfo()
+    info.add_text(seeker.IconAtlas.INDEX_KEY, json.dumps(index), zip=True)
+    atlas.save(output, pnginfo=info)
+    print(f"{output}: {len(index)}枚 ({width}x{height})")
+    return index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="seeker のアイコンとサムネイルを1枚の画像にまとめる")
+    parser.add_argument("--output", default=seeker.ATLAS_PATH, help="書き出すPNGのパス")
+    parser.add_argument("--width", type=int, default=2048, help="まとめ画像の幅")
+    args = parser.parse_args()
+    build_atlas(args.output, width=args.width)
@@ -0,0 +1,251 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+
+# 絞り込みに使う条件の列（-1 は未選択）と、data.csv から読む列
+CRITERIA = ("nightlord", "area", "ifchurch", "loc117", "loc313", "loc112_127")
+CRITERIA_COLUMNS = ("map id",) + CRITERIA
+
+# patterns.db の形式。区画（名前つきの配列か json）を並べ、先頭に区画の一覧を置く
+MAGIC = b"NRPATDB\0"
+VERSION = 1
+HEADER = struct.Struct("<8sII")           # MAGIC, VERSION, 区画数
+SECTION = struct.Struct("<32s1s7xQQ")     # 区画名, 型（array の型コード、json は "j"）, 位置, 長さ
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(ROOT, "seeker", "patterns.db")
+# compile に使う CSV（compile_db の引数名 → 既定のパス）
+DEFAULT_SOURCES = {
+    'map_pattern': os.path.join(ROOT, "mapoutputter", "MAP_PATTERN.csv"),
+    'construct': os.path.join(ROOT, "mapoutputter", "CONSTRUCT.csv"),
+    'coordinates': os.path.join(ROOT, "mapoutputter", "座標.csv"),
+    'names': os.path.join(ROOT, "mapoutputter", "NAME.csv"),
+    'criteria': os.path.join(ROOT, "seeker", "data.csv"),
+}
+
+def file_sha1(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def repair_header(header, row_width=None):
+    """
+    data.csv のヘッダーを直す。"loc112/127" は "loc112_127" に読み替える。
+    area 列が無い古い形式は、行がヘッダーより1列多ければ loc112_127 の前に area の値があるものとして列をずらし、
+    行とヘッダーの列数が同じなら area を 0（地変なし）として扱う。row_width: データ行の列数
+    戻り値は ({列名: 何列目か}（area が無ければ None）, 直したヘッダーの列数)。必要な列が無ければ ValueError
+    """
+    names = [name.strip().replace("112/127", "112_127") for name in header]
+    if "area" not in names and "loc112_127" in names and row_width == len(names) + 1:
+        names.insert(names.index("loc112_127"), "area")
+    positions = {}
+    for name in CRITERIA_COLUMNS:
+        if names.count(name) > 1:
+            raise ValueError(f"data.csv の列が重複しています: {name}")
+        positions[name] = names.index(name) if name in names else None
+    missing = [name for name, pos in positions.items() if pos is None and name != "area"]
+    if missing:
+        raise ValueError(f"data.csv に必要な列がありません: {', '.join(missing)}")
+    return positions, len(names)
+
+def _read_rows(path, encoding="utf-8-sig"):
+    with open(path, "r", encoding=encoding, newline="") as f:
+        return [row for row in csv.reader(f) if row]
+
+def _columns(rows, positions, typecode, path, width=None, first_line=2):
+    """
+    行を列に組み替えてから、列ごとに1回で型つきの配列にする。positions: {列名: 何列目か}
+    width: 指定すると、列数がこれと違う行を ValueError にする（省略時は足りない行だけ）
+    """
+    needed = max(positions.values()) + 1
+    for line, row in enumerate(rows, start=first_line):
+        if width is not None and len(row) != width:
+            raise ValueError(f"{path} の {line} 行目の列数がヘッダーと違います（{len(row)}列、ヘッダーは{width}列）")
+        if len(row) < needed:
+            raise ValueError(f"{path} の {line} 行目の列が足りません")
+    cells = list(zip(*rows)) if rows else [()] * needed
+    convert = float if typecode == "d" else int
+    return {name: array(typecode, map(convert, cells[pos])) for name, pos in positions.items()}
+
+def read_criteria_csv(path):
+    """
+    seeker の data.csv を読み、{列名: array('i')} を返す
+    """
+    rows = _read_rows(path)
+    positions, width = repair_header(rows[0], len(rows[1]) if len(rows) > 1 else None)
+    present = {name: pos for name, pos in positions.items() if pos is not None}
+    columns = _columns(rows[1:], present, "i", path, width)
+    for name in positions:
+        if name not in columns:
+            columns[name] = array("i", bytes(array("i").itemsize * (len(rows) - 1)))
+    return columns
+
+def compile_db(output=DB_PATH, map_pattern=None, construct=None, coordinates=None, names=None, criteria=None):
+    """
+    mapoutputter の CSV（MAP_PATTERN / CONSTRUCT / 座標 / NAME）と seeker の data.csv を
+    1つの patterns.db にまとめる。両方の map id が一致しなければ data.csv の絞り込み条件は入れない
+    """
+    sources = dict(DEFAULT_SOURCES)
+    sources.update({key: path for key, path in (('map_pattern', map_pattern), ('construct', construct),
+                                                 ('coordinates', coordinates), ('names', names),
+                                                 ('criteria', criteria)) if path})
+    sections = {}
+
+    # MAP_PATTERN：全列が整数
+    rows = _read_rows(sources['map_pattern'])
+    pattern_columns = [name.strip() for name in rows[0]]
+    columns = _columns(rows[1:], {name: pos for pos, name in enumerate(pattern_columns)}, "q", sources['map_pattern'],
+                       len(pattern_columns))
+    for name in pattern_columns:
+        sections[f"pattern:{name}"] = columns[name]
+
+    # data.csv：seeker の絞り込み条件。map id が MAP_PATTERN と食い違うとき（data.csv の更新待ちなど）は
+    # 入れずにおき、描画は止めない（seeker は data.csv を直接読む）
+    criteria_columns = read_criteria_csv(sources['criteria'])
+    if list(criteria_columns["map id"]) == list(columns[pattern_columns[0]]):
+        for name in CRITERIA_COLUMNS:
+            sections[f"criteria:{name}"] = criteria_columns[name]
+    else:
+        print(f"警告: {sources['criteria']} の map id が {sources['map_pattern']} の ID と一致しないため、"
+              f"絞り込み条件は入れません")
+
+    # CONSTRUCT：ID, MAP, Struct, is_display, 座標インデクス
+    rows = _read_rows(sources['construct'])
+    columns = _columns(rows[1:], {'map': 1, 'type': 2, 'display': 3, 'coord': 4}, "q", sources['construct'])
+    for name, values in columns.items():
+        sections[f"construct:{name}"] = values
+
+    # 座標：ID と画像上の位置（8・9列目）
+    rows = _read_rows(sources['coordinates'])
+    sections["coord:id"] = _columns(rows[1:], {'id': 0}, "q", sources['coordinates'])['id']
+    for name, values in _columns(rows[1:], {'x': 7, 'y': 8}, "d", sources['coordinates']).items():
+        sections[f"coord:{name}"] = values
+
+    # 名称：ヘッダーなし。ID と名称（空欄は None）
+    rows = _read_rows(sources['names'])
+    sections["names"] = [[int(row[0]), row[1] if len(row) > 1 and row[1] != "" else None] for row in rows]
+
+    sections["meta"] = {
+        'pattern_columns': pattern_columns,
+        'sources': {key: file_sha1(path) for key, path in sources.items()},
+        'compiled_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    PatternDB.write(output, sections)
+    return PatternDB.load(output)
+
+def compile_if_stale(output=DB_PATH, **sources):
+    """
+    patterns.db が無いか、元の CSV が compile したときから変わっていれば compile し直す
+    """
+    paths = dict(DEFAULT_SOURCES)
+    paths.update({key: path for key, path in sources.items() if path})
+    try:
+        db = PatternDB.load(output)
+    except (OSError, ValueError):
+        db = None
+    if db is not None and db.meta.get('sources') == {key: file_sha1(path) for key, path in paths.items()}:
+        return db
+    print(f"パターンデータベースを作成中… {output}")
+    return compile_db(output, **paths)
+
+class PatternDB:
+    """
+    patterns.db を読んだもの。区画名 → array（数値の列）または json の値
+    """
+    def __init__(self, sections):
+        self.sections = sections
+        self.meta = sections.get("meta", {})
+
+    def __getitem__(self, name):
+        return self.sections[name]
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def patterns(self):
+        """
+        MAP_PATTERN の各行を {列名: 値} の辞書で返す
+        """
+        names = self.meta['pattern_columns']
+        columns = [self.sections[f"pattern:{name}"] for name in names]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    def criteria(self):
+        """
+        seeker の絞り込み条件を {列名: array('i')} で返す。compile 時に入れなかった（map id が食い違っていた）なら KeyError
+        """
+        return {name: self.sections[f"criteria:{name}"] for name in CRITERIA_COLUMNS}
+
+    def names(self):
+        return {key: name for key, name in self.sections["names"]}
+
+    @staticmethod
+    def write(path, sections):
+        """
+        sections: {区画名: array または json にできる値}。数値はリトルエンディアンで書く
+        """
+        blobs = []
+        for name, value in sections.items():
+            if isinstance(value, array):
+                if sys.byteorder != "little":
+                    value = array(value.typecode, value)
+                    value.byteswap()
+                blobs.append((name, value.typecode, value.tobytes()))
+            else:
+                blobs.append((name, "j", json.dumps(value, ensure_ascii=False).encode("utf-8")))
+
+        offset = HEADER.size + len(blobs) * SECTION.size
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(blobs)))
+            for name, typecode, data in blobs:
+                f.write(SECTION.pack(name.encode("utf-8"), typecode.encode("ascii"), offset, len(data)))
+                offset += len(data)
+            for _, _, data in blobs:
+                f.write(data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise ValueError(f"パターンデータベースではありません: {path}")
+        magic, version, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"パターンデータベースではありません: {path}")
+        if version != VERSION:
+            raise ValueError(f"パターンデータベースの形式が違います（{version}、対応は{VERSION}）: {path}")
+
+        view = memoryview(data)
+        sections = {}
+        for i in range(count):
+            raw_name, typecode, offset, length = SECTION.unpack_from(data, HEADER.size + i * SECTION.size)
+            name = raw_name.rstrip(b"\0").decode("utf-8")
+            typecode = typecode.decode("ascii")
+            blob = view[offset:offset + length]
+            if typecode == "j":
+                sections[name] = json.loads(bytes(blob).decode("utf-8"))
+            else:
+                values = array(typecode)
+                values.frombytes(blob)
+                if sys.byteorder != "little":
+                    values.byteswap()
+                sections[name] = values
+        return cls(sections)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="マップパターンの CSV を patterns.db にまとめる")
+    parser.add_argument("--output", default=DB_PATH, help="書き出すファイルのパス")
+    for key, path in DEFAULT_SOURCES.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", default=path, help=f"元の CSV（既定: {path}）")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    db = compile_db(args.output, args.map_pattern, args.construct, args.coordinates, args.names, args.criteria)
+    print(f"{args.output}: {len(db.patterns())}パターン, 拠点{len(db['construct:map'])}件 "
+          f"({os.path.getsize(args.output) / 1024:.0f} KB, {time.perf_counter() - start:.2f}秒)")
@@ -1,15 +1,464 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, font as tkfont
 from PIL import Image, ImageTk
-import os, csv
+import os, io, json, math, mmap, queue, shutil, struct, time, logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 絞り込みに使う条件の列（-1 は未選択）と data.csv の読み込みは patterndb と共通
+from patterndb import CRITERIA, PatternDB, file_sha1, read_criteria_csv
+
+# patterndb.py で作るパターンデータベース。data.csv と食い違っていれば data.csv を読む
+PATTERN_DB_PATH = "patterns.db"
+
+# 候補がこの件数以下になったらサムネイルを並べる
+THUMBNAIL_LIMIT = 8
+THUMBNAIL_SIZE = (90, 90)
+
+# ボタンのアイコンの大きさと、拠点パネルの各段のボタン数（0段目は「なし」）
+NIGHTLORD_ICON_SIZE = (100, 100)
+CONSTRUCT_ICON_SIZE = (50, 50)
+SAMPLE_IMAGE_SIZE = (200, 200)
+LOC_ROW_COUNTS = (1, 2, 4, 9, 3)
+
+# build_atlas.py で作る、アイコンとサムネイルを1枚にまとめた画像
+ATLAS_PATH = "assets/atlas.png"
+
+# マップ画像を1つにまとめたファイル（build_archive.py で作る）と、個別の JPEG を置くフォルダ
+MAP_ARCHIVE_PATH = "JPEG.pack"
+MAP_FOLDER = "JPEG"
+
+# マップ表示で、見えている範囲の周りに余分に縮小しておく幅（表示倍率でのピクセル数）。
+# この余白の内側でスクロール・ドラッグしている間は描き直さない
+VIEW_MARGIN = 160
+# ホイール操作が止まってから高画質で描き直すまでの待ち時間(ms)
+REFINE_DELAY_MS = 200
+
+# 読み込み済みのマップ画像を保持する枚数と、候補がこの件数以下になったら先読みする件数
+IMAGE_CACHE_SIZE = 6
+PREFETCH_LIMIT = 4
+# ワーカースレッドの読み込み結果を確認する間隔(ms)
+LOADER_POLL_MS = 30
+
+# JPEG を縮小デコード（draft）できる倍率
+DRAFT_SCALES = (1/8, 1/4, 1/2, 1.0)
+
+# 起動直後に読み込むアイコンを、1回の after でいくつずつ処理するか
+DEFERRED_IMAGES_PER_STEP = 6
+
+log = logging.getLogger("seeker")
+
+def map_image_name(map_id):
+    return f"map_{map_id}.jpg"
+
+def map_image_path(map_id):
+    return f"{MAP_FOLDER}/{map_image_name(map_id)}"
+
+def construct_icon_path(row_idx, col_idx):
+    return f"assets/Construct_{row_idx+1}_{col_idx+1}.png"
+
+def atlas_entries(map_ids):
+    """
+    アトラスに入れる (パス, 大きさ) の一覧。アイコンはボタンを作る順、その後にマップのサムネイル
+    """
+    entries = [(f"assets/nightlord_{idx}.png", NIGHTLORD_ICON_SIZE) for idx in range(8)]
+    entries.append(("assets/sample.jpg", SAMPLE_IMAGE_SIZE))
+    for row_idx, count in enumerate(LOC_ROW_COUNTS):
+        if row_idx > 0:
+            entries += [(construct_icon_path(row_idx, col_idx), CONSTRUCT_ICON_SIZE) for col_idx in range(count)]
+    entries += [(map_image_path(map_id), THUMBNAIL_SIZE) for map_id in map_ids]
+    return entries
+
+def render_icon(source, max_size):
+    """
+    アイコン・サムネイルを表示する大きさに縮小する。JPEG は縮小デコードしてから縮小する。
+    source はパスか、開いた画像
+    """
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    img.draft("RGB", max_size)
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+    return img
+
+def draft_scale(zoom):
+    """
+    表示倍率 zoom を満たす最小の縮小デコード倍率
+    """
+    for scale in DRAFT_SCALES:
+        if scale >= zoom:
+            return scale
+    return 1.0
+
+class ImagePyramid:
+    """
+    1枚の画像を 1, 1/2, 1/4, ... に縮小した段を持つ。画像を読み込んだときに1回だけ作る。
+    image が縮小デコードされたものなら、元の大きさを full_size で渡す（表示の座標は元の大きさで考える）
+    """
+    def __init__(self, image, min_size=256, full_size=None):
+        self.width, self.height = full_size or image.size
+        self.scale = image.width / self.width   # 最も細かい段の、元画像に対する倍率
+        self.levels = [image]
+        while min(self.levels[-1].size) >= min_size * 2:
+            self.levels.append(self.levels[-1].reduce(2))
+
+    def level_for(self, zoom):
+        """
+        表示倍率 zoom 以上の解像度を持つ段のうち、最も小さいものを返す
+        """
+        best = self.levels[0]
+        for level in self.levels:
+            if level.width >= self.width * zoom:
+                best = level
+        return best
+
+class MemoryFile(io.RawIOBase):
+    """
+    memoryview を読み取り専用のファイルとして扱う。中身はコピーせず、読んだ分だけ渡す
+    """
+    def __init__(self, view):
+        self.view = view
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), len(self.view) - self.pos))
+        buffer[:n] = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        self.pos = max(0, offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+class MapArchive:
+    """
+    マップ画像（JPEG のバイト列そのまま）を1つにまとめたファイル。メモリマップで読む。
+    先頭に固定長の索引（マップID → 位置, 長さ, 幅, 高さ）があり、その後ろに画像が並ぶ
+    """
+    MAGIC = b"NRMAPS01"
+    HEADER = struct.Struct("<8sI")      # MAGIC, 件数
+    ENTRY = struct.Struct("<IQIHH")     # マップID, 位置, 長さ, 幅, 高さ
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, count = self.HEADER.unpack_from(self.view, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"マップのまとめファイルではありません: {path}")
+        index = self.view[self.HEADER.size:self.HEADER.size + count * self.ENTRY.size]
+        self.entries = {map_id: (offset, length, (width, height))
+                        for map_id, offset, length, width, height in self.ENTRY.iter_unpack(index)}
+
+    def __contains__(self, map_id):
+        return map_id in self.entries
+
+    def open(self, map_id):
+        offset, length, _ = self.entries[map_id]
+        return Image.open(MemoryFile(self.view[offset:offset + length]))
+
+    @classmethod
+    def write(cls, path, files):
+        """
+        files: (マップID, JPEG のパス) のリスト。索引を先に書き、その後ろに中身をそのまま並べる
+        """
+        files = sorted(files)
+        offset = cls.HEADER.size + len(files) * cls.ENTRY.size
+        entries = []
+        for map_id, file_path in files:
+            with Image.open(file_path) as img:
+                width, height = img.size
+            length = os.path.getsize(file_path)
+            entries.append((map_id, offset, length, width, height))
+            offset += length
+        with open(path, "wb") as out:
+            out.write(cls.HEADER.pack(cls.MAGIC, len(entries)))
+            for entry in entries:
+                out.write(cls.ENTRY.pack(*entry))
+            for map_id, file_path in files:
+                with open(file_path, "rb") as f:
+                    shutil.copyfileobj(f, out)
+        return entries
+
+class MapStore:
+    """
+    マップ画像の置き場所。まとめファイルを優先して読み、JPEG/ の個別のファイルは
+    まとめファイルに無いマップか、まとめファイルの中身と大きさ（バイト数）が違うとき（高画質版への差し替えなど）だけ使う。
+    JPEG/ は起動時に1回だけ一覧を取り、stat は個別のファイルがあるマップを開くときだけ行う
+    """
+    def __init__(self, folder=MAP_FOLDER, archive_path=MAP_ARCHIVE_PATH):
+        self.folder = folder
+        try:
+            with os.scandir(folder) as it:
+                self.loose = {entry.name for entry in it if entry.is_file()}
+        except OSError:
+            self.loose = set()
+        try:
+            self.archive = MapArchive(archive_path)
+        except (OSError, ValueError, struct.error):
+            self.archive = None
+
+    def __contains__(self, map_id):
+        return map_image_name(map_id) in self.loose or (self.archive is not None and map_id in self.archive)
+
+    def open(self, map_id):
+        name = map_image_name(map_id)
+        in_archive = self.archive is not None and map_id in self.archive
+        if name in self.loose:
+            path = os.path.join(self.folder, name)
+            if not in_archive or self.differs(path, map_id):
+                return Image.open(path)
+        if in_archive:
+            return self.archive.open(map_id)
+        raise FileNotFoundError(map_image_path(map_id))
+
+    def differs(self, path, map_id):
+        """
+        個別のファイルがまとめファイルの中身と違うか。読めなければまとめファイルを使う
+        """
+        try:
+            return os.path.getsize(path) != self.archive.entries[map_id][1]
+        except OSError:
+            return False
+
+class ImageLoader:
+    """
+    マップ画像をワーカースレッドで読み込み、結果を root.after でメインスレッドに渡す。
+    読み込んだ画像は縮小段（ImagePyramid）まで作っておき、件数を決めた LRU に残す。
+    Tk にはメインスレッドからしか触らない（ワーカーは結果をキューに入れるだけ）
+    """
+    def __init__(self, root, store, workers=2, capacity=IMAGE_CACHE_SIZE):
+        self.root = root
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.capacity = capacity
+        self.cache = OrderedDict()   # map_id -> ImagePyramid
+        self.pending = set()
+        self.callbacks = {}          # map_id -> [callback]
+        self.results = queue.Queue()
+        self.polling = False
+
+    def get(self, map_id, scale=0):
+        """
+        読み込み済みで、倍率 scale 以上の解像度を持つ画像があれば返す
+        """
+        pyramid = self.cache.get(map_id)
+        if pyramid is None or pyramid.scale < scale:
+            return None
+        self.cache.move_to_end(map_id)
+        return pyramid
+
+    def request(self, map_id, callback, zoom=1.0):
+        """
+        表示倍率 zoom に足りる解像度で読み込み、終わったら callback(map_id, pyramid) を呼ぶ。
+        失敗したときの pyramid は None。読み込み済みならその場で呼ぶ
+        """
+        scale = draft_scale(zoom)
+        pyramid = self.get(map_id, scale)
+        if pyramid is not None:
+            callback(map_id, pyramid)
+            return
+        waiting = self.callbacks.setdefault(map_id, [])
+        if not any(cb == callback and s >= scale for s, cb in waiting):
+            waiting.append((scale, callback))
+        self.submit(map_id, scale)
+
+    def prefetch(self, map_ids, zoom=1.0):
+        """
+        まだ読み込んでいないマップを先に読み込んでおく
+        """
+        scale = draft_scale(zoom)
+        for map_id in map_ids:
+            if self.get(map_id, scale) is None:
+                self.submit(map_id, scale)
+
+    def submit(self, map_id, scale):
+        if (map_id, scale) in self.pending:
+            return
+        self.pending.add((map_id, scale))
+        future = self.executor.submit(self.decode, map_id, scale)
+        future.add_done_callback(lambda f, key=(map_id, scale): self.results.put((key, f)))
+        if not self.polling:
+            self.polling = True
+            self.root.after(LOADER_POLL_MS, self.poll)
+
+    def decode(self, map_id, scale):
+        """
+        JPEG は DCT の段階で縮小してデコードする（draft）。2048px の画像も 1/2 なら画素数は 1/4
+        """
+        image = self.store.open(map_id)
+        full_size = image.size
+        if scale < 1.0:
+            image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image.load()
+        return ImagePyramid(image, full_size=full_size)
+
+    def poll(self):
+        while True:
+            try:
+                (map_id, scale), future = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard((map_id, scale))
+            pyramid = None if future.exception() else future.result()
+            if pyramid is not None:
+                cached = self.cache.get(map_id)
+                if cached is None or cached.scale < pyramid.scale:
+                    self.cache[map_id] = pyramid
+                self.cache.move_to_end(map_id)
+                while len(self.cache) > self.capacity:
+                    self.cache.popitem(last=False)
+                pyramid = self.cache[map_id]
+            self.notify(map_id, pyramid)
+        if self.pending:
+            self.root.after(LOADER_POLL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def notify(self, map_id, pyramid):
+        """
+        待っている callback のうち、解像度が足りたものを呼ぶ。失敗したときは全員に None を渡す
+        """
+        waiting = self.callbacks.pop(map_id, [])
+        called = []
+        for scale, callback in waiting:
+            if pyramid is not None and pyramid.scale < scale:
+                self.callbacks.setdefault(map_id, []).append((scale, callback))
+            elif callback not in called:
+                called.append(callback)
+                callback(map_id, pyramid)
+
+class IconAtlas:
+    """
+    build_atlas.py が作ったまとめ画像。索引（(パス, 大きさ) → 位置）は PNG のテキストに入っている。
+    ファイルが無いか読めないときは空として扱い、呼び出し側が元の画像から作る
+    """
+    INDEX_KEY = "atlas-index"
+
+    def __init__(self, path=ATLAS_PATH):
+        self.image = None
+        self.boxes = {}
+        try:
+            image = Image.open(path)
+            index = json.loads(image.text[self.INDEX_KEY])
+            image.load()
+        except (OSError, KeyError, ValueError):
+            return
+        self.image = image
+        self.boxes = {(entry["path"], tuple(entry["size"])): tuple(entry["box"]) for entry in index}
+
+    def get(self, path, max_size):
+        box = self.boxes.get((path, tuple(max_size)))
+        if box is None:
+            return None
+        x, y, w, h = box
+        return self.image.crop((x, y, x + w, y + h))
+
+class PatternTable:
+    """
+    マップパターンの表。map id と絞り込み条件の列を、列ごとに型つきの配列（array('i')）で持つ
+    """
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["map id"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @classmethod
+    def load(cls, filename):
+        return cls(read_criteria_csv(filename))
+
+    @classmethod
+    def open(cls, db_path=PATTERN_DB_PATH, csv_path="data.csv"):
+        """
+        パターンデータベースから読む。無いとき、または data.csv が compile した後に変わっているときは data.csv を読む
+        """
+        try:
+            db = PatternDB.load(db_path)
+        except (OSError, ValueError):
+            db = None
+        if db is not None and "criteria:map id" not in db:
+            log.info("パターン: %s に絞り込み条件が無いので %s を読みます", db_path, csv_path)
+        elif db is not None:
+            if not os.path.exists(csv_path) or db.meta.get("sources", {}).get("criteria") == file_sha1(csv_path):
+                log.info("パターン: %s", db_path)
+                return cls(db.criteria())
+            log.info("パターン: %s が %s より古いので CSV を読みます", db_path, csv_path)
+        return cls.load(csv_path)
+
+class PatternIndex:
+    """
+    マップパターンの検索用インデックス。
+    6条件をまとめたキー → マップID の表と、条件ごと・値ごとのビット集合（int）を持つ。
+    ビット i は表の i 番目の行を表す。
+    """
+    def __init__(self, table):
+        self.map_ids = table["map id"]
+        self.all_bits = (1 << len(table)) - 1
+        self.exact = {}
+        self.bits = {field: {} for field in CRITERIA}
+        for pos, key in enumerate(zip(*(table[field] for field in CRITERIA))):
+            self.exact.setdefault(key, []).append(self.map_ids[pos])
+            for field, value in zip(CRITERIA, key):
+                self.bits[field][value] = self.bits[field].get(value, 0) | (1 << pos)
+
+    def candidates(self, criteria):
+        """
+        criteria: {列名: 値}。-1 の条件は無視して、一致する行のビット集合を返す
+        """
+        bits = self.all_bits
+        for field in CRITERIA:
+            value = criteria.get(field, -1)
+            if value == -1:
+                continue
+            bits &= self.bits[field].get(value, 0)
+            if not bits:
+                break
+        return bits
+
+    def ids(self, bits):
+        """
+        ビット集合をマップIDのリスト（行順）に変換する
+        """
+        ids = []
+        while bits:
+            low = bits & -bits
+            ids.append(self.map_ids[low.bit_length() - 1])
+            bits ^= low
+        return ids
+
+    def lookup(self, criteria):
+        """
+        条件に一致するマップIDのリストを返す。すべての条件が決まっていれば表を直接引く
+        """
+        key = tuple(criteria.get(field, -1) for field in CRITERIA)
+        if -1 not in key:
+            return list(self.exact.get(key, []))
+        return self.ids(self.candidates(criteria))
 
 class MapFilterApp:
-    def __init__(self, root):
+    def __init__(self, root, started=None):
         self.root = root
+        self.started = time.perf_counter() if started is None else started
         self.root.title("夜渡り地図帳")
         self.root.geometry("1400x900")
 
-        self.data = self.load_csv("data.csv")
+        self.data = PatternTable.open()
+        self.index = PatternIndex(self.data)
 
         self.nightlord_var = tk.IntVar(value=-1)
         self.area_var = tk.IntVar(value=-1)
@@ -34,33 +483,33 @@ class MapFilterApp:
         self.current_photo = None
         self.map_image_id = None
 
-        self.create_widgets()
+        # 見えている範囲（と周りの余白）だけを縮小して1つのキャンバスアイテムに表示する
+        self.pyramid = None
+        self.canvas_size = None   # 表示倍率での画像全体の大きさ（スクロール範囲）
+        self.view_box = None      # 描画済みの範囲 (倍率, 画質, left, top, right, bottom)
+        self.zooming = False
+        self.render_job = None
+        self.refine_job = None
+
+        # 条件を選ぶたびに絞り込む候補（PatternIndex のビット集合）
+        self.selected = {field: -1 for field in CRITERIA}
+        self.candidate_bits = self.index.all_bits
+
+        # マップ画像は別スレッドで読み込む。表示待ちのマップIDを覚えておく
+        self.store = MapStore()
+        self.loader = ImageLoader(self.root, self.store)
+        self.shown_map_id = None
+
+        # アイコンは (パス, 大きさ) ごとに1回だけ読み込み、同じ PhotoImage を各ボタンで共有する。
+        # ウィンドウを先に表示し、画像はその後で読み込む
+        self.atlas = None
+        self.images = {}
+        self.placeholders = {}
+        self.deferred_images = []
 
-    def load_csv(self, filename):
-        rows = []
-        with open(filename, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            fieldnames = reader.fieldnames
-
-            # 表のヘッダーを自動修正
-            fixed_fieldnames = []
-            for name in fieldnames:
-                if name == "loc112/127":   # 位置ずれを検出
-                    if "area" not in fieldnames:
-                        fixed_fieldnames.append("area")  # area プレースホルダーを挿入
-                    fixed_fieldnames.append("loc112_127")
-                else:
-                    fixed_fieldnames.append(name.replace("112/127", "112_127"))
-
-            for row in reader:
-                parsed = {}
-                for k, v in zip(fixed_fieldnames, row.values()):
-                    try:
-                        parsed[k] = int(v)
-                    except (ValueError, TypeError):
-                        parsed[k] = v
-                rows.append(parsed)
-        return rows
+        self.create_widgets()
+        log.info("ウィジェット作成: %.3f秒", time.perf_counter() - self.started)
+        self.root.after_idle(self.on_window_shown)
 
     def create_widgets(self):
         container = ttk.Frame(self.root)
@@ -126,10 +575,9 @@ class MapFilterApp:
         nightlord_frame = ttk.LabelFrame(left_frame, text="夜の王を選択してください", padding="5")
         nightlord_frame.grid(row=0, column=0, sticky="ew", pady=5)
         for idx in range(8):
-            img = self.load_image(f"assets/nightlord_{idx}.png", (100, 100))
-            btn = tk.Button(nightlord_frame, image=img, relief="flat",
+            btn = tk.Button(nightlord_frame, relief="flat",
                             command=lambda i=idx: self.select("nightlord", i))
-            btn.image = img
+            self.defer_image(btn, f"assets/nightlord_{idx}.png", NIGHTLORD_ICON_SIZE)
             btn.grid(row=idx // 4, column=idx % 4, padx=3, pady=3)
             self.all_buttons["nightlord"].append((btn, idx))
 
@@ -154,9 +602,8 @@ class MapFilterApp:
         yes_btn.grid(row=3, column=0, pady=30)
         no_btn.grid(row=1, column=0, pady=30)
         self.all_buttons["ifchurch"] = [(yes_btn, 1), (no_btn, 0)]
-        sample_img = self.load_image("assets/sample.jpg", (200, 200))
-        sample_label = ttk.Label(ifchurch_frame, image=sample_img)
-        sample_label.image = sample_img
+        sample_label = ttk.Label(ifchurch_frame)
+        self.defer_image(sample_label, "assets/sample.jpg", SAMPLE_IMAGE_SIZE)
         sample_label.grid(row=0, column=2, padx=10)
 
         # loc117
@@ -186,7 +633,14 @@ class MapFilterApp:
 
         y_scroll = ttk.Scrollbar(map_frame, orient="vertical", command=self.map_canvas.yview)
         x_scroll = ttk.Scrollbar(map_frame, orient="horizontal", command=self.map_canvas.xview)
-        self.map_canvas.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+        # 表示範囲が変わるたびに（スクロール・ドラッグ・ズーム）描画済みの範囲に収まっているか確かめる
+        def on_yscroll(*args):
+            y_scroll.set(*args)
+            self.request_render()
+        def on_xscroll(*args):
+            x_scroll.set(*args)
+            self.request_render()
+        self.map_canvas.configure(yscrollcommand=on_yscroll, xscrollcommand=on_xscroll)
 
         y_scroll.grid(row=0, column=1, sticky="ns")
         x_scroll.grid(row=1, column=0, sticky="ew")
@@ -226,7 +680,24 @@ class MapFilterApp:
         )
         filter_btn.grid(row=3, column=0, pady=10, ipadx=8, ipady=6)
 
+        # 候補の件数とサムネイル（条件を選ぶたびに更新）
+        candidate_frame = ttk.LabelFrame(right_frame, text="候補のマップ", padding="5")
+        candidate_frame.grid(row=4, column=0, pady=5, sticky="ew")
+        self.candidate_label = ttk.Label(candidate_frame, text=f"候補: {len(self.data)}件")
+        self.candidate_label.grid(row=0, column=0, sticky="w")
+        self.thumbnail_strip = ttk.Frame(candidate_frame)
+        self.thumbnail_strip.grid(row=1, column=0, sticky="w")
+
+    def on_window_shown(self):
+        """
+        ウィンドウを表示してから、初期画像とアイコンを読み込む
+        """
+        self.root.update_idletasks()
+        log.info("ウィンドウ表示: %.3f秒", time.perf_counter() - self.started)
+        self.atlas = IconAtlas()
+        log.info("アトラス: %d件", len(self.atlas.boxes))
         self.load_initial_image()
+        self.load_deferred_images()
 
     # === ドラッグ ===
     def start_drag(self, event):
@@ -254,21 +725,53 @@ class MapFilterApp:
                                     command=lambda v=value, t=loc_type: self.select_loc(v, t))
                 else:
                     value = (row_idx * 10 + col_idx + 1) if row_idx < 4 else ((row_idx + 1) * 10 + col_idx + 1)
-                    img = self.load_image(f"assets/construct_{row_idx+1}_{col_idx+1}.png", (50, 50))
-                    btn = tk.Button(row_frame, image=img, relief="flat",
+                    btn = tk.Button(row_frame, relief="flat",
                                     command=lambda v=value, t=loc_type: self.select_loc(v, t))
-                    btn.image = img
+                    self.defer_image(btn, construct_icon_path(row_idx, col_idx), CONSTRUCT_ICON_SIZE)
                     btn.config(width=50, height=50)
                 btn.grid(row=0, column=col_idx, padx=2)
                 self.all_buttons[loc_type].append((btn, value))
 
-    def load_image(self, path, max_size):
-        try:
-            img = Image.open(path)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            return ImageTk.PhotoImage(img)
-        except Exception:
-            return ImageTk.PhotoImage(Image.new("RGB", max_size, "gray"))
+    def load_image(self, path, max_size, opener=None):
+        """
+        (パス, 大きさ) ごとに1回だけ読み込む。アトラスにあればそこから切り出し、無ければ元の画像を縮小する。
+        opener を渡すと、元の画像はパスの代わりに opener() で開く
+        """
+        key = (path, max_size)
+        photo = self.images.get(key)
+        if photo is None:
+            try:
+                img = self.atlas.get(path, max_size) if self.atlas else None
+                if img is None:
+                    img = render_icon(opener() if opener else path, max_size)
+                photo = ImageTk.PhotoImage(img)
+            except Exception:
+                photo = ImageTk.PhotoImage(Image.new("RGB", max_size, "gray"))
+            self.images[key] = photo
+        return photo
+
+    def defer_image(self, widget, path, max_size):
+        """
+        widget には同じ大きさの空の画像を仮に置き、画像の読み込みは load_deferred_images に回す
+        """
+        placeholder = self.placeholders.get(max_size)
+        if placeholder is None:
+            placeholder = self.placeholders[max_size] = tk.PhotoImage(width=max_size[0], height=max_size[1])
+        widget.configure(image=placeholder)
+        self.deferred_images.append((widget, path, max_size))
+
+    def load_deferred_images(self):
+        """
+        後回しにした画像を上から順に少しずつ読み込む（その間も操作できるように after で分ける）
+        """
+        batch = self.deferred_images[:DEFERRED_IMAGES_PER_STEP]
+        del self.deferred_images[:DEFERRED_IMAGES_PER_STEP]
+        for widget, path, max_size in batch:
+            widget.configure(image=self.load_image(path, max_size))
+        if self.deferred_images:
+            self.root.after(1, self.load_deferred_images)
+        else:
+            log.info("アイコン読み込み完了: %.3f秒（%d枚）", time.perf_counter() - self.started, len(self.images))
 
     def update_button_states(self, category, selected_value):
         for btn, value in self.all_buttons[category]:
@@ -285,7 +788,7 @@ class MapFilterApp:
         elif category == "ifchurch":
             self.ifchurch_var.set(value)
         self.update_button_states(category, value)
-
+        self.narrow_candidates(category, value)
 
     def select_loc(self, value, loc_type):
         if loc_type == "loc117":
@@ -295,6 +798,51 @@ class MapFilterApp:
         elif loc_type == "loc112_127":
             self.loc112_127_var.set(value)
         self.update_button_states(loc_type, value)
+        self.narrow_candidates(loc_type, value)
+
+    def narrow_candidates(self, field, value):
+        """
+        条件が1つ選ばれるたびに候補を絞り込む。
+        未選択だった条件が決まったときは前回の候補との積をとるだけで、
+        選び直したときだけインデックスから作り直す。
+        """
+        previous = self.selected[field]
+        if previous == value:
+            return
+        self.selected[field] = value
+        if previous == -1:
+            self.candidate_bits &= self.index.bits[field].get(value, 0)
+        else:
+            self.candidate_bits = self.index.candidates(self.selected)
+        self.show_candidates()
+
+    def show_candidates(self):
+        """
+        候補の件数を表示し、少なければサムネイルを並べる。1件に決まったらそのマップを表示する
+        """
+        count = bin(self.candidate_bits).count("1")
+        self.candidate_label.config(text=f"候補: {count}件")
+        for child in self.thumbnail_strip.winfo_children():
+            child.destroy()
+        if count == 0 or count > THUMBNAIL_LIMIT:
+            return
+
+        ids = self.index.ids(self.candidate_bits)
+        if count <= PREFETCH_LIMIT:
+            self.loader.prefetch(ids, self.zoom)
+        for col, map_id in enumerate(ids):
+            photo = self.load_thumbnail(map_id)
+            btn = tk.Button(self.thumbnail_strip, image=photo, text=f"map_{map_id}", compound="top",
+                            relief="flat", command=lambda m=map_id: self.show_map(m))
+            btn.grid(row=0, column=col, padx=2)
+        if count == 1:
+            self.show_map(ids[0])
+
+    def load_thumbnail(self, map_id):
+        """
+        候補一覧用の小さなサムネイル
+        """
+        return self.load_image(map_image_path(map_id), THUMBNAIL_SIZE, lambda: self.store.open(map_id))
 
     def load_initial_image(self):
         """
@@ -303,20 +851,33 @@ class MapFilterApp:
         p = self.initial_image_path
         if p and os.path.exists(p):
             try:
-                self.current_image = Image.open(p)
-                self.scale_image()  # 既存の描画処理を再利用
+                self.shown_map_id = None
+                self.set_image(Image.open(p))
                 return
             except Exception as e:
                 self.current_image = None
-                self.map_canvas.delete("all")
+                self.clear_map()
                 self.map_name_label.config(text=f"初期画像の読み込み失敗: {e}")
                 return
 
         # パスが無い／見つからない場合
         self.current_image = None
-        self.map_canvas.delete("all")
+        self.clear_map()
         self.map_name_label.config(text=f"初期画像が見つかりません: {p}")
 
+    def current_criteria(self):
+        """
+        選択中の条件を {列名: 値} で返す（未選択は -1）
+        """
+        return {
+            "nightlord": self.nightlord_var.get(),
+            "area": self.area_var.get(),
+            "ifchurch": self.ifchurch_var.get(),
+            "loc117": self.loc117_var.get(),
+            "loc313": self.loc313_var.get(),
+            "loc112_127": self.loc112_127_var.get(),
+        }
+
     def filter_data(self):
         if -1 in (self.nightlord_var.get(), self.area_var.get(),
                 self.ifchurch_var.get(),
@@ -324,44 +885,129 @@ class MapFilterApp:
             messagebox.showwarning("メッセージ", "すべてのフィルター条件を選択してください")
             return
 
-        filtered = [
-            row for row in self.data
-            if row.get("nightlord") == self.nightlord_var.get()
-            and row.get("area") == self.area_var.get()
-            and row.get("ifchurch") == self.ifchurch_var.get()
-            and row.get("loc117") == self.loc117_var.get()
-            and row.get("loc313") == self.loc313_var.get()
-            and row.get("loc112_127") == self.loc112_127_var.get()
-        ]
+        filtered = self.index.lookup(self.current_criteria())
 
         if not filtered:
-            self.map_canvas.delete("all")
+            self.clear_map()
             self.map_name_label.config(text="一致するマップが見つかりません")
             self.load_initial_image()
         else:
-            map_id = filtered[0]["map id"]
-            image_path = f"JPEG/map_{map_id}.jpg"
-            if os.path.exists(image_path):
-                self.current_image = Image.open(image_path)
-                self.scale_image()
-            else:
-                self.map_canvas.delete("all")
-                self.map_name_label.config(text=f"画像が見つかりません: {image_path}")
-                self.load_initial_image()
-            self.map_name_label.config(text=f"map_{map_id}.jpg")
+            self.show_map(filtered[0])
+
+    def show_map(self, map_id):
+        """
+        マップ画像の読み込みを依頼する。表示は読み込みが終わってから on_map_loaded で行う
+        """
+        self.shown_map_id = map_id
+        self.map_name_label.config(text=f"map_{map_id}.jpg 読み込み中…")
+        self.loader.request(map_id, self.on_map_loaded, self.zoom)
+
+    def on_map_loaded(self, map_id, pyramid):
+        if map_id != self.shown_map_id:
+            return  # 読み込み中に別のマップが選ばれた
+        if pyramid is None:
+            self.clear_map()
+            self.load_initial_image()
+            self.map_name_label.config(text=f"画像が見つかりません: {map_image_path(map_id)}")
+            return
+        self.set_image(pyramid.levels[0], pyramid)
+        self.map_name_label.config(text=f"map_{map_id}.jpg")
+
+    def set_image(self, image, pyramid=None):
+        """
+        表示する画像を差し替える。縮小段（ピラミッド）は読み込み時に作ったものを使う
+        """
+        if pyramid is None:
+            image.load()
+            pyramid = ImagePyramid(image)
+        self.current_image = image
+        self.pyramid = pyramid
+        self.view_box = None
+        self.scale_image()
+
+    def clear_map(self):
+        self.map_canvas.delete("all")
+        self.map_image_id = None
+        self.current_photo = None
+        self.pyramid = None
+        self.canvas_size = None
+        self.view_box = None
 
     def scale_image(self, *args):
+        """
+        表示倍率に合わせてスクロール範囲を設定し、見えている範囲の描画を予約する
+        """
         if self.current_image:
             s = float(self.zoom)
-            width  = max(1, int(self.current_image.width  * s))
-            height = max(1, int(self.current_image.height * s))
-            img = self.current_image.resize((width, height), Image.Resampling.LANCZOS)
-            self.current_photo = ImageTk.PhotoImage(img)
-
-            self.map_canvas.delete("all")
-            self.map_image_id = self.map_canvas.create_image(0, 0, anchor="nw", image=self.current_photo)
-            self.map_canvas.configure(scrollregion=(0, 0, width, height))
-    
+            size = (max(1, int(self.pyramid.width * s)), max(1, int(self.pyramid.height * s)))
+            if size != self.canvas_size:
+                self.canvas_size = size
+                self.map_canvas.configure(scrollregion=(0, 0) + size)
+            self.request_render()
+
+            # 縮小デコードした解像度を超えて拡大したら、足りる解像度で読み直す
+            if self.shown_map_id is not None and self.pyramid.scale < s:
+                self.loader.request(self.shown_map_id, self.on_map_loaded, s)
+
+    def request_render(self):
+        """
+        表示範囲の描画を予約する。連続した呼び出しは1回にまとめる
+        """
+        if self.render_job is None:
+            self.render_job = self.root.after_idle(self.render_view)
+
+    def render_view(self):
+        """
+        見えている範囲に余白 VIEW_MARGIN を足した部分だけを縮小し、キャンバスの画像アイテムを差し替える。
+        描画済みの範囲に収まっていれば何もしないので、元画像の解像度によらず1回の手間は表示の大きさで決まる
+        """
+        self.render_job = None
+        if not self.current_image or self.pyramid is None:
+            return
+        quality = "draft" if self.zooming else "high"
+        width, height = self.canvas_size
+
+        left = max(0, int(self.map_canvas.canvasx(0)))
+        top  = max(0, int(self.map_canvas.canvasy(0)))
+        right  = min(width,  left + self.map_canvas.winfo_width())
+        bottom = min(height, top  + self.map_canvas.winfo_height())
+        if right <= left or bottom <= top:
+            return
+
+        box = self.view_box
+        if (box is not None and box[0] == self.zoom and (box[1] == "high" or quality == "draft")
+                and box[2] <= left and box[3] <= top and right <= box[4] and bottom <= box[5]):
+            return
+
+        x0, y0 = max(0, left - VIEW_MARGIN), max(0, top - VIEW_MARGIN)
+        x1, y1 = min(width, right + VIEW_MARGIN), min(height, bottom + VIEW_MARGIN)
+        # 表示倍率以上の解像度を持つ最小の段から切り出して縮小する
+        level = self.pyramid.level_for(self.zoom)
+        ratio = level.width / (self.pyramid.width * self.zoom)
+        # 操作中は速い BILINEAR、止まったら LANCZOS
+        resample = Image.Resampling.LANCZOS if quality == "high" else Image.Resampling.BILINEAR
+        view = level.resize((x1 - x0, y1 - y0), resample, box=(x0 * ratio, y0 * ratio, x1 * ratio, y1 * ratio))
+
+        # 大きさが同じなら Tk の画像を作り直さずに中身だけ書き換える
+        if self.current_photo is not None and (self.current_photo.width(), self.current_photo.height()) == view.size:
+            self.current_photo.paste(view)
+        else:
+            self.current_photo = ImageTk.PhotoImage(view)
+        if self.map_image_id is None:
+            self.map_image_id = self.map_canvas.create_image(x0, y0, anchor="nw", image=self.current_photo)
+        else:
+            self.map_canvas.coords(self.map_image_id, x0, y0)
+            self.map_canvas.itemconfigure(self.map_image_id, image=self.current_photo)
+        self.view_box = (self.zoom, quality, x0, y0, x1, y1)
+
+    def refine(self):
+        """
+        ホイール操作が止まったら、見えている範囲を高画質で描き直す
+        """
+        self.refine_job = None
+        self.zooming = False
+        self.request_render()
+
     def on_zoom(self, event):
         """マウスホイールでズーム。端(上限/下限)では位置を動かさない。"""
         if not self.current_image:
@@ -393,6 +1039,12 @@ class MapFilterApp:
         effective = new_zoom / old_zoom
         self.zoom = new_zoom
 
+        # 操作中は速い縮小で描き、止まってから高画質に差し替える
+        self.zooming = True
+        if self.refine_job is not None:
+            self.root.after_cancel(self.refine_job)
+        self.refine_job = self.root.after(REFINE_DELAY_MS, self.refine)
+
         # キャンバス座標でのマウス位置（この近辺を保つ）
         cx = self.map_canvas.canvasx(event.x)
         cy = self.map_canvas.canvasy(event.y)
@@ -401,8 +1053,8 @@ class MapFilterApp:
         self.scale_image()
 
         # 新しい画像サイズ
-        new_w = max(1, int(self.current_image.width  * self.zoom))
-        new_h = max(1, int(self.current_image.height * self.zoom))
+        new_w = max(1, int(self.pyramid.width  * self.zoom))
+        new_h = max(1, int(self.pyramid.height * self.zoom))
 
         # 可視領域
         view_w = self.map_canvas.winfo_width()
@@ -430,8 +1082,11 @@ class MapFilterApp:
         self.scale_image()
 
 def main():
+    started = time.perf_counter()
+    logging.basicConfig(filename="seeker.log", level=logging.INFO,
+                        format="%(asctime)s %(message)s", encoding="utf-8")
     root = tk.Tk()
-    app = MapFilterApp(root)
+    app = MapFilterApp(root, started)
     root.mainloop()
 
 if __name__ == "__main__":
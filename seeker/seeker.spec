@@ -3,6 +3,20 @@
 
 block_cipher = None
 
+# アイコンとマップのサムネイルを assets/atlas.png に、マップ画像を JPEG.pack に、
+# マップパターンの CSV を patterns.db にまとめ直す
+import os, sys
+sys.path.insert(0, SPECPATH)
+import build_atlas, build_archive, patterndb
+_cwd = os.getcwd()
+os.chdir(SPECPATH)
+try:
+    build_atlas.build_atlas()
+    build_archive.build_archive()
+    patterndb.compile_if_stale()
+finally:
+    os.chdir(_cwd)
+
 
 a = Analysis(
     ['seeker.py'],